@@ -0,0 +1,8 @@
+-- Create "vendor_snapshots" table
+CREATE TABLE `vendor_snapshots` (
+  `week` date NOT NULL,
+  `vendor_hash` bigint NOT NULL,
+  `snapshot` mediumblob NOT NULL,
+  `fetched_at` datetime NULL,
+  PRIMARY KEY (`week`, `vendor_hash`)
+) CHARSET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
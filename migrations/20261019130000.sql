@@ -0,0 +1,7 @@
+-- Create "item_watches" table
+CREATE TABLE `item_watches` (
+  `user_id` bigint NOT NULL,
+  `item_hash` bigint NOT NULL,
+  `created_at` datetime NULL,
+  PRIMARY KEY (`user_id`, `item_hash`)
+) CHARSET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
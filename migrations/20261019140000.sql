@@ -0,0 +1,16 @@
+-- Create "armor_stat_alerts" table
+CREATE TABLE `armor_stat_alerts` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `user_id` bigint NOT NULL,
+  `class_name` varchar(16) NULL,
+  `exotic_only` bool NULL,
+  `min_total` int NULL,
+  `min_mobility` int NULL,
+  `min_resilience` int NULL,
+  `min_recovery` int NULL,
+  `min_discipline` int NULL,
+  `min_intellect` int NULL,
+  `min_strength` int NULL,
+  PRIMARY KEY (`id`),
+  INDEX `ix_armor_stat_alerts_user_id` (`user_id`)
+) CHARSET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
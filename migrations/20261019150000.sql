@@ -0,0 +1,11 @@
+-- Create "xur_item_sales" table
+CREATE TABLE `xur_item_sales` (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `item_hash` bigint NOT NULL,
+  `week` date NOT NULL,
+  `location` varchar(64) NULL,
+  `roll` varchar(256) NULL,
+  PRIMARY KEY (`id`),
+  INDEX `ix_xur_item_sales_item_hash_week` (`item_hash`, `week`),
+  INDEX `ix_xur_item_sales_week` (`week`)
+) CHARSET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
@@ -0,0 +1,7 @@
+-- Create "lost_sector_rotation" table
+CREATE TABLE `lost_sector_rotation` (
+  `day` date NOT NULL,
+  `sector` blob NOT NULL,
+  `synced_at` datetime NULL,
+  PRIMARY KEY (`day`)
+) CHARSET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
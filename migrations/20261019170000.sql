@@ -0,0 +1,2 @@
+-- Clear pickled sectors from "lost_sector_rotation" table, they are re-synced from the sheet as json
+DELETE FROM `lost_sector_rotation`;
@@ -0,0 +1,7 @@
+-- Create "xur_notifications" table
+CREATE TABLE `xur_notifications` (
+  `kind` varchar(32) NOT NULL,
+  `week` date NOT NULL,
+  `notified_at` datetime NULL,
+  PRIMARY KEY (`kind`, `week`)
+) CHARSET utf8mb4 COLLATE utf8mb4_0900_ai_ci;
@@ -0,0 +1,161 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import datetime as dt
+import typing as t
+
+import attr
+import numpy as np
+
+from . import bungie_api as api
+from . import schemas, vendor_history
+
+# Minimum number of historical rolls in a class and slot before ranking against it
+MIN_HISTORY = 5
+# Share of historical rolls a stat must beat to count as a spike
+SPIKE_TOP_SHARE = 0.1
+
+_ArmorGroup = t.Tuple[str, str | None]
+
+
+def _armor_group(armor_piece: api.DestinyArmor) -> _ArmorGroup:
+    return armor_piece.class_, armor_piece.bucket
+
+
+@attr.s(frozen=True)
+class ArmorRollRank:
+    """How an armor roll compares to historical rolls in the same class and slot
+
+    Shares are the fraction of historical rolls that are at least as good, so
+    smaller is better, and 0 means the roll beats every historical roll"""
+
+    history_size: int = attr.ib()
+    total_top_share: float = attr.ib()
+    best_in_slot: bool = attr.ib()
+    spike_stat: str | None = attr.ib()
+    spike_top_share: float = attr.ib()
+
+    def summary(self) -> str:
+        if self.best_in_slot:
+            summary = f"Best of {self.history_size} rolls"
+        else:
+            top_percent = max(round(self.total_top_share * 100), 1)
+            summary = f"Top {top_percent}% of {self.history_size} rolls"
+        if self.spike_stat:
+            summary += f", {self.spike_stat} spike"
+        return summary
+
+
+class ArmorRollHistory:
+    """Historical armor stat vectors as one roll x stat matrix per class and slot
+
+    Stat columns are in the order of `DestinyArmor._tracked_stats`"""
+
+    def __init__(self, armor_pieces: t.Iterable[api.DestinyArmor]):
+        rolls: t.Dict[_ArmorGroup, t.List[np.ndarray]] = {}
+        for armor_piece in armor_pieces:
+            rolls.setdefault(_armor_group(armor_piece), []).append(
+                armor_piece.stat_values
+            )
+
+        self.matrices: t.Dict[_ArmorGroup, np.ndarray] = {
+            group: np.stack(stat_vectors) for group, stat_vectors in rolls.items()
+        }
+        self.totals: t.Dict[_ArmorGroup, np.ndarray] = {
+            group: matrix.sum(axis=1) for group, matrix in self.matrices.items()
+        }
+
+    def __len__(self) -> int:
+        return sum(len(matrix) for matrix in self.matrices.values())
+
+    def rank(
+        self, armor_pieces: t.Sequence[api.DestinyArmor]
+    ) -> t.List[ArmorRollRank | None]:
+        """Ranks each armor piece against the history of its class and slot
+
+        All pieces in a class and slot are ranked together in a single broadcast
+        comparison against its history. Pieces with fewer than `MIN_HISTORY`
+        historical rolls to compare against are ranked as None"""
+        ranks: t.List[ArmorRollRank | None] = [None] * len(armor_pieces)
+
+        rows_by_group: t.Dict[_ArmorGroup, t.List[int]] = {}
+        for row, armor_piece in enumerate(armor_pieces):
+            rows_by_group.setdefault(_armor_group(armor_piece), []).append(row)
+
+        for group, rows in rows_by_group.items():
+            history = self.matrices.get(group)
+            if history is None or len(history) < MIN_HISTORY:
+                continue
+
+            rolls = np.stack([armor_pieces[row].stat_values for row in rows])
+            totals = rolls.sum(axis=1)
+            history_totals = self.totals[group]
+
+            total_top_shares = (history_totals[None, :] >= totals[:, None]).mean(axis=1)
+            best_in_slot = totals >= history_totals.max()
+            # rolls x stats share of history at or above each stat of each roll
+            stat_top_shares = (history[None, :, :] >= rolls[:, None, :]).mean(axis=1)
+            # A stat of 0 is never a spike, however rare
+            stat_top_shares[rolls == 0] = 1.0
+            spike_columns = stat_top_shares.argmin(axis=1)
+            spike_top_shares = stat_top_shares[np.arange(len(rows)), spike_columns]
+
+            for i, row in enumerate(rows):
+                is_spike = spike_top_shares[i] <= SPIKE_TOP_SHARE
+                ranks[row] = ArmorRollRank(
+                    history_size=len(history),
+                    total_top_share=float(total_top_shares[i]),
+                    best_in_slot=bool(best_in_slot[i]),
+                    spike_stat=(
+                        api.DestinyArmor._tracked_stats[spike_columns[i]]
+                        if is_spike
+                        else None
+                    ),
+                    spike_top_share=float(spike_top_shares[i]),
+                )
+
+        return ranks
+
+
+_roll_histories: t.Dict[t.Tuple[str | None, dt.date], ArmorRollHistory] = {}
+
+
+async def exotic_armor_roll_history(
+    manifest_table: dict, before_week: dt.date | None = None
+) -> ArmorRollHistory:
+    """Returns the history of exotic armor rolls sold by Xûr before a week
+
+    Built from stored vendor snapshots once per manifest version and week"""
+    before_week = before_week or vendor_history.xur_week()
+    key = (getattr(manifest_table, "version", None), before_week)
+    if key in _roll_histories:
+        return _roll_histories[key]
+
+    armor_pieces: t.List[api.DestinyArmor] = []
+    for _, _, snapshot in await schemas.VendorSnapshot.get_snapshots(
+        before_week=before_week
+    ):
+        vendor = api.DestinyVendor.from_vendors_api_response(
+            vendor_history.decode_vendor_response(snapshot),
+            manifest_table=manifest_table,
+        )
+        armor_pieces.extend(
+            item for item in vendor.sale_items if item.is_exotic and item.is_armor
+        )
+
+    # Only keep the latest history around
+    _roll_histories.clear()
+    _roll_histories[key] = ArmorRollHistory(armor_pieces)
+    return _roll_histories[key]
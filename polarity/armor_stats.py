@@ -0,0 +1,151 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import typing as t
+
+import numpy as np
+
+# DestinyItemType.Mod, the item type of armor stat and mod plugs
+DESTINY_ITEM_TYPE_MOD = 19
+
+
+class ArmorStatEngine:
+    """Computes armor stat vectors from reusable plugs and intrinsic stats
+
+    Built once per manifest version. The investment stats of every mod plug in
+    the manifest are held as a plug x stat matrix, and the intrinsic stats of
+    every armor piece as an item x stat matrix, with columns in the order of
+    `tracked_stats`. The last row of each matrix is all zeros and is used for
+    hashes that contribute no tracked stats."""
+
+    def __init__(self, manifest_table: dict, tracked_stats: t.Sequence[str]):
+        self.tracked_stats = tuple(tracked_stats)
+
+        stat_columns: t.Dict[int, int] = {}
+        for stat_hash, stat_entry in manifest_table["DestinyStatDefinition"].items():
+            stat_name = stat_entry.get("displayProperties", {}).get("name")
+            if stat_name in self.tracked_stats:
+                stat_columns[int(stat_hash)] = self.tracked_stats.index(stat_name)
+
+        plug_stats: t.Dict[int, t.List[t.Tuple[int, int]]] = {}
+        intrinsic_stats: t.Dict[int, t.List[t.Tuple[int, int]]] = {}
+        for item_hash, item_entry in manifest_table[
+            "DestinyInventoryItemDefinition"
+        ].items():
+            if item_entry.get("itemType") == DESTINY_ITEM_TYPE_MOD:
+                stats = [
+                    (stat["statTypeHash"], stat["value"])
+                    for stat in item_entry.get("investmentStats", [])
+                ]
+                target = plug_stats
+            else:
+                stats = [
+                    (stat_hash, stat["value"])
+                    for stat_hash, stat in item_entry.get("stats", {})
+                    .get("stats", {})
+                    .items()
+                ]
+                target = intrinsic_stats
+
+            stats = [
+                (stat_columns[int(stat_hash)], value)
+                for stat_hash, value in stats
+                if value and int(stat_hash) in stat_columns
+            ]
+            if stats:
+                target[item_hash] = stats
+
+        self.plug_rows, self.plug_matrix = self._build_matrix(plug_stats)
+        self.intrinsic_rows, self.intrinsic_matrix = self._build_matrix(intrinsic_stats)
+
+    def _build_matrix(
+        self, stats: t.Dict[int, t.List[t.Tuple[int, int]]]
+    ) -> t.Tuple[t.Dict[int, int], np.ndarray]:
+        rows = {hash_: row for row, hash_ in enumerate(stats)}
+        matrix = np.zeros((len(rows) + 1, len(self.tracked_stats)), dtype=np.int32)
+        for hash_, row in rows.items():
+            for column, value in stats[hash_]:
+                matrix[row, column] += value
+        return rows, matrix
+
+    def stat_vectors(
+        self,
+        item_hashes: t.Sequence[int],
+        plug_hashes: t.Sequence[t.Sequence[int]],
+    ) -> np.ndarray:
+        """Returns an item x stat matrix of the stats of each item
+
+        Each item's stats are the sum of the investment stats of its plugs and
+        its own intrinsic stats. `plug_hashes` holds the plug hashes of each
+        item in `item_hashes`, in the same order."""
+        no_plug_row = len(self.plug_rows)
+        plug_rows = [
+            self.plug_rows.get(plug_hash, no_plug_row)
+            for item_plug_hashes in plug_hashes
+            for plug_hash in item_plug_hashes
+        ]
+        plug_owners = np.repeat(
+            np.arange(len(item_hashes)),
+            [len(item_plug_hashes) for item_plug_hashes in plug_hashes],
+        )
+
+        no_intrinsic_row = len(self.intrinsic_rows)
+        stat_vectors = self.intrinsic_matrix[
+            [
+                self.intrinsic_rows.get(item_hash, no_intrinsic_row)
+                for item_hash in item_hashes
+            ]
+        ]
+        np.add.at(stat_vectors, plug_owners, self.plug_matrix[plug_rows])
+        return stat_vectors
+
+
+class ArmorStats(t.Mapping[str, int]):
+    """Read only armor stats held as a fixed order integer array
+
+    `values` holds one entry per tracked stat, positioned as per `positions`,
+    and `total` is computed once on construction so reads never allocate."""
+
+    __slots__ = ("_positions", "values", "total")
+
+    def __init__(self, positions: t.Mapping[str, int], values: t.Sequence[int]):
+        self._positions = positions
+        self.values: np.ndarray = np.asarray(values, dtype=np.int32)
+        self.values.setflags(write=False)
+        self.total = int(self.values.sum())
+
+    @classmethod
+    def from_named_stats(
+        cls,
+        positions: t.Mapping[str, int],
+        named_stats: t.Iterable[t.Tuple[str | None, int]],
+    ) -> t.Self:
+        values = np.zeros(len(positions), dtype=np.int32)
+        for stat_name, stat_value in named_stats:
+            if stat_name in positions:
+                values[positions[stat_name]] = stat_value
+        return cls(positions, values)
+
+    def __getitem__(self, stat_name: str) -> int:
+        return int(self.values[self._positions[stat_name]])
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
@@ -29,7 +29,8 @@ def make_autopost_control_commands(
     enabled_getter: t.Coroutine[t.Any, t.Any, bool],
     enabled_setter: t.Coroutine[t.Any, t.Any, None],
     channel_id: int,
-    message_constructor_coro: t.Coroutine[t.Any, t.Any, HMessage],
+    # Posts too long for one message are constructed as a list of messages
+    message_constructor_coro: t.Coroutine[t.Any, t.Any, HMessage | t.List[HMessage]],
     message_announcer_coro: t.Coroutine[t.Any, t.Any, None] = None,
 ) -> t.Callable:
     @lb.command(
@@ -105,11 +106,17 @@ def make_autopost_control_commands(
     async def show(ctx: lb.Context):
         await ctx.respond("Gathering data...")
         try:
-            message: HMessage = await message_constructor_coro(ctx.app)
+            messages: HMessage | t.List[HMessage] = await message_constructor_coro(
+                ctx.app
+            )
         except Exception as e:
             logger.exception(e)
             await ctx.edit_last_response("An error occurred!\n" + str(e))
         else:
-            await ctx.edit_last_response(**message.to_message_kwargs())
+            if isinstance(messages, HMessage):
+                messages = [messages]
+            await ctx.edit_last_response(**messages[0].to_message_kwargs())
+            for message in messages[1:]:
+                await ctx.respond(**message.to_message_kwargs())
 
     return parent_group
@@ -1,6 +1,8 @@
 import asyncio
 import datetime as dt
+import enum
 import json
+import logging
 import os
 import sys
 import typing as t
@@ -14,9 +16,11 @@ import aiohttp
 import aiohttp.web
 import aiosqlite
 import lightbulb as lb
+import numpy as np
 from yarl import URL
 
 from . import cfg, schemas
+from .armor_stats import ArmorStatEngine, ArmorStats
 
 BUNGIE_NET = "https://www.bungie.net"
 API_ROOT = BUNGIE_NET + "/Platform"
@@ -63,7 +67,7 @@ components = (
     # "306,"  # DestinyComponentType.ItemTalentGrids
     # "307,"  # DestinyComponentType.ItemCommonData
     # "308,"  # DestinyComponentType.ItemPlugStates
-    # "310,"  # DestinyComponentType.ItemReusablePlugs
+    "310,"  # DestinyComponentType.ItemReusablePlugs
     "400,"  # DestinyComponentType.Vendors
     "402"  # DestinyComponentType.VendorSales
 )
@@ -88,6 +92,40 @@ manifest_table_names = [
 DESTINY_ITEM_TYPE_WEAPON = 3
 DESTINY_ITEM_TYPE_ARMOR = 2
 
+_T = t.TypeVar("_T")
+
+
+class PlugKind(enum.IntEnum):
+    OTHER = 0
+    INTRINSIC = 1
+    BARREL = 2
+    MAGAZINE = 3
+    TRAIT = 4
+    ORIGIN = 5
+    MASTERWORK = 6
+    TRACKER = 7
+    SHADER = 8
+
+
+# Weapon plug category identifiers as seen in DestinyInventoryItemDefinition.plug
+_PLUG_KINDS_BY_CATEGORY = {
+    "intrinsics": PlugKind.INTRINSIC,
+    "barrels": PlugKind.BARREL,
+    "blades": PlugKind.BARREL,
+    "bowstrings": PlugKind.BARREL,
+    "hafts": PlugKind.BARREL,
+    "scopes": PlugKind.BARREL,
+    "tubes": PlugKind.BARREL,
+    "arrows": PlugKind.MAGAZINE,
+    "batteries": PlugKind.MAGAZINE,
+    "guards": PlugKind.MAGAZINE,
+    "magazines": PlugKind.MAGAZINE,
+    "magazines_gl": PlugKind.MAGAZINE,
+    "frames": PlugKind.TRAIT,
+    "origins": PlugKind.ORIGIN,
+    "shader": PlugKind.SHADER,
+}
+
 
 def likely_emoji_name(name: str) -> str:
     return name.replace(" ", "_").replace("-", "_").lower()
@@ -131,8 +169,14 @@ class OAuthStateManager:
     # Note, chaining @classmethod and @property is deprecated in
     # python 3.13, hence the getter method here
     @classmethod
-    def get_access_token(cls) -> str | None:
-        if cls._access_token_expires and cls._access_token_expires > dt.datetime.now():
+    def get_access_token(
+        cls, min_validity: dt.timedelta = dt.timedelta()
+    ) -> str | None:
+        """Returns the access token if it stays valid for at least `min_validity`"""
+        if (
+            cls._access_token_expires
+            and cls._access_token_expires > dt.datetime.now() + min_validity
+        ):
             return cls._access_token
 
     @classmethod
@@ -191,12 +235,46 @@ async def _get_latest_manifest(api_key: str) -> str:
     return manifest_path
 
 
-async def _build_manifest_dict(manifest_path: str):
+class ManifestTable(dict):
+    """Manifest tables keyed by table name, for a single manifest version
+
+    Indexes derived from the manifest are memoized on the table by
+    `manifest_index` so they are built once per manifest version."""
+
+    def __init__(self, *args, version: str | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = version
+        self.indexes: t.Dict[t.Callable[[dict], t.Any], t.Any] = {}
+
+
+def manifest_index(manifest_table: dict, builder: t.Callable[[dict], _T]) -> _T:
+    """Returns the index built by `builder` for this manifest table
+
+    The index is memoized for the lifetime of the manifest version if the
+    manifest table is a ManifestTable, and rebuilt on every call otherwise."""
+    if not isinstance(manifest_table, ManifestTable):
+        return builder(manifest_table)
+
+    try:
+        return manifest_table.indexes[builder]
+    except KeyError:
+        index = manifest_table.indexes[builder] = builder(manifest_table)
+        return index
+
+
+# Only the latest manifest version is kept in memory
+_manifest_tables: t.Dict[str, ManifestTable] = {}
+
+
+async def _build_manifest_dict(manifest_path: str) -> ManifestTable:
+    if manifest_path in _manifest_tables:
+        return _manifest_tables[manifest_path]
+
     # connect to the manifest
     async with aiosqlite.connect(manifest_path) as con:
         # create a cursor object
         cur = await con.cursor()
-        all_data = {}
+        all_data = ManifestTable(version=manifest_path)
         # for every table name in the dictionary
         for table_name in manifest_table_names:
             # get a list of all the jsons from the table
@@ -213,9 +291,36 @@ async def _build_manifest_dict(manifest_path: str):
                 # as a key.
                 item_dict[item["hash"]] = item
             all_data[table_name] = item_dict
+
+    _manifest_tables.clear()
+    _manifest_tables[manifest_path] = all_data
     return all_data
 
 
+async def get_manifest_table(api_key: str | None = None) -> ManifestTable:
+    """Returns the latest manifest table
+
+    Falls back to the last manifest table built, or the last manifest
+    downloaded, if the latest manifest cannot be fetched from the API."""
+    try:
+        manifest_path = await _get_latest_manifest(
+            api_key or schemas.BungieCredentials.api_key
+        )
+    except (aiohttp.ClientError, asyncio.TimeoutError, KeyError) as e:
+        if _manifest_tables:
+            manifest_path = next(iter(_manifest_tables))
+        elif os.path.isdir("manifest") and os.listdir("manifest"):
+            manifest_path = "manifest/" + os.listdir("manifest")[0]
+        else:
+            raise
+
+        logging.warning(
+            f"Could not fetch the latest manifest ({e!r}), using {manifest_path}"
+        )
+
+    return await _build_manifest_dict(manifest_path)
+
+
 class VendorNotFound(Exception):
     def __init__(self, message, api_response=None):
         self.message = message
@@ -300,19 +405,160 @@ class DestinyMembership:
             return data["Response"]["profile"]["data"]["characterIds"][character_index]
 
 
+def _component_entries(component: dict | None, key: str) -> t.Iterable[dict]:
+    """Entries of a per item component, with or without its wrapping key"""
+    if not component:
+        return ()
+    if key in component:
+        component = component[key]
+    if isinstance(component, dict):
+        return component.values()
+    return component
+
+
+def _plug_hashes_by_socket(
+    plugs: t.Dict[str, t.Dict[str, t.List[dict]]] | None,
+) -> t.Tuple[t.Tuple[int, ...], ...]:
+    if not plugs:
+        return ()
+    if "plugs" in plugs:
+        plugs = plugs["plugs"]
+    return tuple(
+        tuple(plug["plugItemHash"] for plug in plugs[socket_index])
+        for socket_index in sorted(plugs, key=int)
+    )
+
+
+def _display_name(entry: dict | None, default: str | None = None) -> str | None:
+    return (entry or {}).get("displayProperties", {}).get("name", default)
+
+
+class _SaleItemColumns:
+    """Column oriented view of the sale items in a vendor response
+
+    All item, cost, stat and perk hashes referenced by the sales, stats and perks
+    components are gathered first and each unique hash is resolved against the
+    manifest exactly once. Items are then built from the resolved columns by
+    row index."""
+
+    def __init__(
+        self,
+        sale_items: t.Dict[str, dict],
+        stats: t.Dict[str, dict],
+        perks: t.Dict[str, dict],
+        manifest_table: dict,
+        reusable_plugs: t.Dict[str, dict] | None = None,
+    ):
+        reusable_plugs = reusable_plugs or {}
+        self.keys = list(sale_items.keys())
+        self.item_hashes: t.List[int] = [
+            sale_items[key]["itemHash"] for key in self.keys
+        ]
+        self.costs: t.List[t.List[t.Tuple[int, int]]] = [
+            [
+                (cost.get("itemHash", 0), cost.get("quantity", 0))
+                for cost in sale_items[key].get("costs", [])
+            ]
+            for key in self.keys
+        ]
+        self.stats: t.List[t.List[t.Tuple[int, int]]] = [
+            [
+                (int(stat["statHash"]), stat["value"])
+                for stat in _component_entries(stats.get(key), "stats")
+            ]
+            for key in self.keys
+        ]
+        self.perks: t.List[t.List[int]] = [
+            [perk["perkHash"] for perk in _component_entries(perks.get(key), "perks")]
+            for key in self.keys
+        ]
+        # Reusable plug hashes per socket, ordered by socket index
+        self.plugs: t.List[t.Tuple[t.Tuple[int, ...], ...]] = [
+            _plug_hashes_by_socket(reusable_plugs.get(key)) for key in self.keys
+        ]
+
+        item_table: dict = manifest_table["DestinyInventoryItemDefinition"]
+        self.item_entries: t.Dict[int, dict] = {
+            hash_: item_table[hash_] for hash_ in set(self.item_hashes)
+        }
+
+        cost_hashes = {hash_ for costs in self.costs for hash_, _ in costs if hash_}
+        self.cost_names: t.Dict[int, str] = {
+            hash_: _display_name(item_table.get(hash_), "") for hash_ in cost_hashes
+        }
+
+        stat_table: dict = manifest_table["DestinyStatDefinition"]
+        stat_hashes = {hash_ for stats in self.stats for hash_, _ in stats}
+        self.stat_names: t.Dict[int, str | None] = {
+            hash_: _display_name(stat_table.get(hash_)) for hash_ in stat_hashes
+        }
+
+        perk_table: dict = manifest_table["DestinySandboxPerkDefinition"]
+        perk_hashes = {hash_ for perks in self.perks for hash_ in perks}
+        self.perk_names: t.Dict[int, str | None] = {
+            hash_: _display_name(perk_table.get(hash_)) for hash_ in perk_hashes
+        }
+
+        slot_table: dict = manifest_table["DestinyEquipmentSlotDefinition"]
+        bucket_hashes = {
+            entry["inventory"]["bucketTypeHash"] for entry in self.item_entries.values()
+        }
+        self.bucket_names: t.Dict[int, str | None] = {}
+        for hash_ in bucket_hashes:
+            bucket = slot_table.get(hash_)
+            self.bucket_names[hash_] = (
+                bucket["displayProperties"]
+                .get("name", "Unknown Slot")
+                .replace("Armor", "")
+                .strip()
+                if bucket
+                else None
+            )
+
+        # Collectibles are memoized per manifest version and resolve their
+        # presentation nodes only when first asked for
+        self.collectibles: t.Dict[int, DestinyCollectible] = {
+            entry["collectibleHash"]: DestinyCollectible.from_collectible_hash(
+                entry["collectibleHash"], manifest_table
+            )
+            for entry in self.item_entries.values()
+            if "collectibleHash" in entry
+        }
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
 class DestinyItem:
     @classmethod
     def from_sale_item(
         cls,
         sale_item: dict,
-        # reusable_plugs: dict,
         stats: dict,
         perks: dict,
         manifest_table: dict,
+        reusable_plugs: dict | None = None,
     ):
-        hash_ = sale_item["itemHash"]
+        columns = _SaleItemColumns(
+            {"0": sale_item},
+            {"0": stats},
+            {"0": perks},
+            manifest_table,
+            reusable_plugs={"0": reusable_plugs},
+        )
+        self = cls.from_sale_item_columns(columns, 0)
+        if self.is_weapon and columns.plugs[0]:
+            self.with_plug_hashes(columns.plugs[0], manifest_table)
+        elif self.is_armor and columns.plugs[0]:
+            DestinyArmor.with_batched_reusable_plugs(
+                [self], columns.plugs, manifest_table
+            )
+        return self
 
-        manifest_entry = manifest_table["DestinyInventoryItemDefinition"][hash_]
+    @classmethod
+    def from_sale_item_columns(cls, columns: _SaleItemColumns, row: int) -> t.Self:
+        hash_ = columns.item_hashes[row]
+        manifest_entry = columns.item_entries[hash_]
 
         name: str = manifest_entry["displayProperties"]["name"]
         rarity: str = manifest_entry["inventory"].get("tierTypeName", "Unknown Rarity")
@@ -322,48 +568,18 @@ class DestinyItem:
             if class_ < len(DESTINY_CLASSES_ENUM)
             else "Unknown"
         )
-        bucket: int = manifest_entry["inventory"]["bucketTypeHash"]
-        bucket: dict | None = manifest_table["DestinyEquipmentSlotDefinition"].get(
-            bucket
-        )
-        if bucket:
-            bucket: str = (
-                bucket["displayProperties"]
-                .get("name", "Unknown Slot")
-                .replace("Armor", "")
-                .strip()
-            )
+        bucket: str | None = columns.bucket_names[
+            manifest_entry["inventory"]["bucketTypeHash"]
+        ]
 
         item_type: int = manifest_entry["itemType"]
         item_type_friendly_name: str = manifest_entry["itemTypeDisplayName"]
 
-        collectible_set_name = (
-            (
-                DestinyCollectible.from_collectible_hash(
-                    manifest_entry["collectibleHash"], manifest_table
-                )
-                .parent_nodes[0]
-                .name
-            )
-            if "collectibleHash" in manifest_entry
-            else None
-        )
+        collectible = columns.collectibles.get(manifest_entry.get("collectibleHash"))
 
-        costs_data = sale_item.get("costs", [])
         costs = {}
-        for cost in costs_data:
-            item_hash = cost.get("itemHash", 0)
-            quantity = cost.get("quantity", 0)
-            if item_hash:
-                item_name = (
-                    manifest_table["DestinyInventoryItemDefinition"]
-                    .get(item_hash, {})
-                    .get("displayProperties", {})
-                    .get("name", "")
-                )
-
-            else:
-                item_name = ""
+        for item_hash, quantity in columns.costs[row]:
+            item_name = columns.cost_names[item_hash] if item_hash else ""
             if item_name:
                 costs[item_name] = quantity
 
@@ -376,11 +592,16 @@ class DestinyItem:
             bucket=bucket,
             item_type=item_type,
             item_type_friendly_name=item_type_friendly_name,
-            collectible_set_name=collectible_set_name,
+            collectible=collectible,
             costs=costs,
         )
-        self: t.Self = self.with_stats(stats, manifest_table)
-        self: t.Self = self.with_perks(perks, manifest_table)
+        self: t.Self = self.with_named_stats(
+            (columns.stat_names[stat_hash], stat_value)
+            for stat_hash, stat_value in columns.stats[row]
+        )
+        self: t.Self = self.with_named_perks(
+            columns.perk_names[perk_hash] for perk_hash in columns.perks[row]
+        )
 
         return self
 
@@ -395,6 +616,7 @@ class DestinyItem:
         item_type_friendly_name: str,
         collectible_set_name: str = None,
         costs: t.Dict[str, int] = {},
+        collectible: "DestinyCollectible | None" = None,
     ):
         self.name = name
         self.hash = hash_
@@ -403,7 +625,8 @@ class DestinyItem:
         self.bucket = bucket
         self.item_type = item_type
         self.item_type_friendly_name = item_type_friendly_name
-        self.collectible_set_name = collectible_set_name
+        self._collectible_set_name = collectible_set_name
+        self.collectible = collectible
         self.costs = costs
 
     def __repr__(self):
@@ -413,6 +636,13 @@ class DestinyItem:
             + f" - Type: {self.item_type_friendly_name}\n"
         )
 
+    @property
+    def collectible_set_name(self) -> str | None:
+        if self._collectible_set_name is None and self.collectible:
+            parent_nodes = self.collectible.parent_nodes
+            self._collectible_set_name = parent_nodes[0].name if parent_nodes else None
+        return self._collectible_set_name
+
     @staticmethod
     def get_appropriate_subclass(item_type: int) -> t.Type[t.Self]:
         if item_type == DESTINY_ITEM_TYPE_WEAPON:
@@ -459,24 +689,18 @@ class DestinyItem:
         | t.Dict[str, t.Dict[str, t.Dict[str, int]]],
         manifest_table: dict,
     ) -> t.Self:
-        self._stats = {}
-
-        if not stats:
-            return self
-
-        if "stats" in stats:
-            stats = stats["stats"]
+        stat_table: dict = manifest_table["DestinyStatDefinition"]
+        return self.with_named_stats(
+            (_display_name(stat_table.get(int(stat["statHash"]))), stat["value"])
+            for stat in _component_entries(stats, "stats")
+        )
 
-        for stat_group in stats.values():
-            stat_hash = stat_group["statHash"]
-            stat_value = stat_group["value"]
+    def with_named_stats(
+        self, named_stats: t.Iterable[t.Tuple[str | None, int]]
+    ) -> t.Self:
+        self._stats = {}
 
-            stat_name = (
-                manifest_table["DestinyStatDefinition"]
-                .get(int(stat_hash), {})
-                .get("displayProperties", {})
-                .get("name")
-            )
+        for stat_name, stat_value in named_stats:
             if stat_name:
                 self._stats[stat_name] = stat_value
 
@@ -492,26 +716,14 @@ class DestinyItem:
         | t.Dict[str, t.Dict[str, t.Dict[str, t.Any]]],
         manifest_table: dict,
     ) -> t.Self:
-        self._perks = []
-
-        if not perks:
-            return self
-
-        if "perks" in perks:
-            perks = perks["perks"]
-
-        for perk_group in perks:
-            perk_group: t.Dict[str, t.Any]
-            perk_entry = manifest_table["DestinySandboxPerkDefinition"][
-                perk_group["perkHash"]
-            ]
-            perk_name = perk_entry["displayProperties"]["name"]
-
-            if not perk_name:
-                continue
-
-            self._perks.append(perk_name)
+        perk_table: dict = manifest_table["DestinySandboxPerkDefinition"]
+        return self.with_named_perks(
+            _display_name(perk_table[perk["perkHash"]])
+            for perk in _component_entries(perks, "perks")
+        )
 
+    def with_named_perks(self, perk_names: t.Iterable[str | None]) -> t.Self:
+        self._perks = [perk_name for perk_name in perk_names if perk_name]
         return self
 
     @property
@@ -523,31 +735,74 @@ class DestinyWeapon(DestinyItem):
     def __init__(self, *, perks: t.Tuple[t.Tuple[str]] = None, **kwargs):
         super().__init__(**kwargs)
         self._perks = perks
+        self._perk_column_kinds: t.Tuple[PlugKind, ...] = ()
 
     @staticmethod
     def _plugs_to_perks(
         plugs_array: t.Dict[str, list], manifest_table: dict
-    ) -> t.Tuple[str]:
-        # CAUTION: This cannot yet differentiate between masterworks, kill trackets and
-        #          actual perks
-        if "plugs" in plugs_array:
-            plugs_array: dict = plugs_array["plugs"]
-
-        perks = []
-        for plugs in plugs_array.values():
-            perks_in_array_segment = []
-            for plug in plugs:
-                plug_hash = plug["plugItemHash"]
-                plug_json = manifest_table["DestinyInventoryItemDefinition"][plug_hash]
-                perks_in_array_segment.append(plug_json["displayProperties"]["name"])
-            perks.append(tuple(perks_in_array_segment))
-
-        return tuple(perks)
+    ) -> t.Tuple[t.Tuple[str]]:
+        return DestinyWeapon._plug_hashes_to_perks(
+            _plug_hashes_by_socket(plugs_array), manifest_table
+        )
+
+    @staticmethod
+    def _plug_hashes_to_perks(
+        plug_hashes: t.Tuple[t.Tuple[int, ...], ...], manifest_table: dict
+    ) -> t.Tuple[t.Tuple[str]]:
+        plug_names: t.Dict[int, str] = manifest_index(manifest_table, _plug_name_index)
+        return tuple(
+            tuple(
+                plug_names[plug_hash]
+                for plug_hash in socket_plug_hashes
+                if plug_hash in plug_names
+            )
+            for socket_plug_hashes in plug_hashes
+        )
+
+    @staticmethod
+    def _plug_hashes_to_column_kinds(
+        plug_hashes: t.Tuple[t.Tuple[int, ...], ...], manifest_table: dict
+    ) -> t.Tuple[PlugKind, ...]:
+        # A socket takes the kind of the first of its plugs that has one
+        plug_kinds: t.Dict[int, PlugKind] = manifest_index(
+            manifest_table, _plug_kind_index
+        )
+        return tuple(
+            next(
+                (
+                    plug_kinds[plug_hash]
+                    for plug_hash in socket_plug_hashes
+                    if plug_hash in plug_kinds
+                ),
+                PlugKind.OTHER,
+            )
+            for socket_plug_hashes in plug_hashes
+        )
 
     def with_reusable_plugs(self, plugs: t.Dict[str, list], manifest_table: dict):
-        self._perks = self._plugs_to_perks(plugs, manifest_table)
+        return self.with_plug_hashes(_plug_hashes_by_socket(plugs), manifest_table)
+
+    def with_plug_hashes(
+        self, plug_hashes: t.Tuple[t.Tuple[int, ...], ...], manifest_table: dict
+    ) -> t.Self:
+        self._perks = self._plug_hashes_to_perks(plug_hashes, manifest_table)
+        self._perk_column_kinds = self._plug_hashes_to_column_kinds(
+            plug_hashes, manifest_table
+        )
         return self
 
+    @property
+    def perk_column_kinds(self) -> t.Tuple[PlugKind, ...]:
+        """Kind of each perk column, empty if perks are not from reusable plugs"""
+        return self._perk_column_kinds
+
+    def perk_columns_of_kind(self, kind: PlugKind) -> t.List[int]:
+        return [
+            column
+            for column, column_kind in enumerate(self._perk_column_kinds)
+            if column_kind == kind
+        ]
+
     def __repr__(self):
         return super().__repr__() + (
             f" - Perks: {self._perks_representation(self.perks)}\n"
@@ -572,6 +827,7 @@ class DestinyArmor(DestinyItem):
         "Intellect",
         "Strength",
     ]
+    _stat_positions = {name: position for position, name in enumerate(_tracked_stats)}
 
     def __init__(
         self,
@@ -580,100 +836,59 @@ class DestinyArmor(DestinyItem):
         **kwargs,
     ):
         super().__init__(**kwargs)
-        self._stats = stats
-        self._intrinsic_stats_added = False
+        self.stats = stats
 
-        for stat in self._tracked_stats:
-            if stat not in self.stats:
-                self.stats[stat] = 0
+    def with_named_stats(
+        self, named_stats: t.Iterable[t.Tuple[str | None, int]]
+    ) -> t.Self:
+        self._stats = ArmorStats.from_named_stats(self._stat_positions, named_stats)
+        return self
 
-    @staticmethod
-    def _get_stat_name(manifest_table: dict, hash_: int):
-        return (
-            manifest_table["DestinyStatDefinition"]
-            .get(int(hash_), {})
-            .get("displayProperties", {})
-            .get("name")
-        )
+    def with_stat_vector(self, stat_vector: t.Sequence[int]) -> t.Self:
+        self._stats = ArmorStats(self._stat_positions, stat_vector)
+        return self
 
-    def _add_intrinsic_stats(self, manifest_table: dict):
-        if self._intrinsic_stats_added:
-            return
+    def with_reusable_plugs(self, plugs: t.Dict[str, list], manifest_table: dict):
+        self._plugs = plugs
+        return self.with_batched_reusable_plugs(
+            [self], [_plug_hashes_by_socket(plugs)], manifest_table
+        )[0]
 
-        manifest_entry: dict = manifest_table["DestinyInventoryItemDefinition"][
-            self.hash
+    @classmethod
+    def with_batched_reusable_plugs(
+        cls,
+        armor_pieces: t.List[t.Self],
+        plugs: t.List[t.Tuple[t.Tuple[int, ...], ...]],
+        manifest_table: dict,
+    ) -> t.List[t.Self]:
+        """Fills in the stats of armor pieces that the stats component left out,
+        computing them from their rolled plugs in one batched operation
+
+        The reusable plugs component lists every option a socket offers, so only
+        sockets with a single option, such as the stat roll sockets, are summed.
+        Selectable sockets like mod slots would inflate the stats. Pieces that
+        already have stats from the stats component are left untouched"""
+        missing_stats = [
+            (armor_piece, sockets)
+            for armor_piece, sockets in zip(armor_pieces, plugs)
+            if not armor_piece.stat_total
         ]
+        if not missing_stats:
+            return armor_pieces
 
-        stats: dict = manifest_entry.get("stats", {})
-        stats = stats.get("stats", {})
-
-        for stat_hash, stat_dict in stats.items():
-            stat_name = self._get_stat_name(manifest_table, stat_hash)
-            stat_value = stat_dict["value"]
-            if stat_name and stat_name in self.stats:
-                self.stats[stat_name] += stat_value
-
-        self._intrinsic_stats_added = True
-
-    def _plugs_to_stats(
-        self,
-        plugs: t.Dict[
-            str,  # -------------------> Key always seems to be "plugs" here
-            t.Dict[
-                str | int,  # ---------> Key is always an int as a str
-                t.List[  # ------------> List with a single element :(
-                    t.Dict[
-                        str,  # -------> Only "canInsert", "enabled", or "plugItemHash"
-                        bool | int,  # > Either bool, bool or int respectively
-                    ],
-                ],
-            ],
-        ],
-        manifest_table: dict,
-    ) -> t.Tuple[int]:
-        plugs: t.Dict[
-            str | int,  # ---------> Key is always an int as a str
-            t.List[  # ------------> List with a single element :(
-                t.Dict[
-                    str,  # -------> Only "canInsert", "enabled", or "plugItemHash"
-                    bool | int,  # > Either bool, bool or int respectively
-                ],
+        stat_engine: ArmorStatEngine = manifest_index(
+            manifest_table, _armor_stat_engine
+        )
+        stat_vectors = stat_engine.stat_vectors(
+            [armor_piece.hash for armor_piece, _ in missing_stats],
+            [
+                [socket[0] for socket in sockets if len(socket) == 1]
+                for _, sockets in missing_stats
             ],
-        ] = plugs["plugs"]
-
-        for plug in plugs.values():
-            plug: t.List[  # ------------> List with a single element :(
-                t.Dict[
-                    str,  # -------> Only "canInsert", "enabled", or "plugItemHash"
-                    bool | int,  # > Either bool, bool or int respectively
-                ],
-            ]
-            for plug_dict in plug:
-                plug_dict: t.Dict[
-                    str,  # -------> Only "canInsert", "enabled", or "plugItemHash"
-                    bool | int,  # > Either bool, bool or int respectively
-                ]
-                plug_item_hash = plug_dict["plugItemHash"]
-
-                # Pull the plug json from the manifest and work with that to calculate
-                # the stats
-                plug_json = manifest_table["DestinyInventoryItemDefinition"][
-                    plug_item_hash
-                ]
-                if plug_json["itemType"] == 19:
-                    plug_stats: dict = plug_json["investmentStats"]
-                    for stat_value in plug_stats:
-                        stat_hash = stat_value["statTypeHash"]
-                        stat_value = stat_value["value"]
-                        stat_name = self._get_stat_name(manifest_table, stat_hash)
-                        if stat_name and stat_name in self.stats:
-                            self.stats[stat_name] += stat_value
-
-    def with_reusable_plugs(self, plugs: t.Dict[str, list], manifest_table: dict):
-        self._plugs = plugs
-        # self._plugs_to_stats(plugs, manifest_table)
-        # self._add_intrinsic_stats(manifest_table)
-        return self
+        )
+        for (armor_piece, _), stat_vector in zip(missing_stats, stat_vectors):
+            armor_piece.with_stat_vector(stat_vector)
+        return armor_pieces
 
     @property
     def armor_set_name(self) -> str | None:
@@ -682,17 +897,21 @@ class DestinyArmor(DestinyItem):
         return self.collectible_set_name
 
     @property
-    def stats(self) -> dict:
-        self._stats = {name: self._stats.get(name, 0) for name in self._tracked_stats}
+    def stats(self) -> ArmorStats:
         return self._stats
 
     @stats.setter
-    def stats(self, stats: dict):
-        self._stats = {name: stats.get(name, 0) for name in self._tracked_stats}
+    def stats(self, stats: t.Mapping[str, int]):
+        self.with_named_stats(stats.items())
+
+    @property
+    def stat_values(self) -> np.ndarray:
+        """Stat values in the order of `_tracked_stats`"""
+        return self._stats.values
 
     @property
     def stat_total(self) -> int:
-        return sum(self.stats.values())
+        return self._stats.total
 
     def __repr__(self):
         return (
@@ -715,16 +934,66 @@ class DestinyArmor(DestinyItem):
         )
 
 
+def _plug_name_index(manifest_table: dict) -> t.Dict[int, str]:
+    """Plug item hash to display name for every named plug in the manifest"""
+    return {
+        hash_: name
+        for hash_, entry in manifest_table["DestinyInventoryItemDefinition"].items()
+        if "plug" in entry and (name := _display_name(entry))
+    }
+
+
+def _plug_kind(plug_category_identifier: str) -> PlugKind:
+    if plug_category_identifier in _PLUG_KINDS_BY_CATEGORY:
+        return _PLUG_KINDS_BY_CATEGORY[plug_category_identifier]
+    elif "tracker" in plug_category_identifier:
+        return PlugKind.TRACKER
+    elif "masterwork" in plug_category_identifier:
+        return PlugKind.MASTERWORK
+    elif "shader" in plug_category_identifier:
+        return PlugKind.SHADER
+    return PlugKind.OTHER
+
+
+def _plug_kind_index(manifest_table: dict) -> t.Dict[int, PlugKind]:
+    """Plug item hash to kind for every classifiable plug in the manifest"""
+    plug_kinds = {}
+    for hash_, entry in manifest_table["DestinyInventoryItemDefinition"].items():
+        if "plug" not in entry:
+            continue
+        plug_kind = _plug_kind(entry["plug"].get("plugCategoryIdentifier", ""))
+        if plug_kind != PlugKind.OTHER:
+            plug_kinds[hash_] = plug_kind
+    return plug_kinds
+
+
+def _armor_stat_engine(manifest_table: dict) -> ArmorStatEngine:
+    return ArmorStatEngine(manifest_table, DestinyArmor._tracked_stats)
+
+
+def _collectibles(manifest_table: dict) -> t.Dict[int, "DestinyCollectible"]:
+    return {}
+
+
+def _presentation_nodes(manifest_table: dict) -> t.Dict[int, "DestinyPresentationNode"]:
+    return {}
+
+
 class DestinyCollectible:
     @classmethod
     def from_collectible_hash(cls, collectible_hash: int, manifest_table: dict):
-        return cls(
-            manifest_table["DestinyCollectibleDefinition"][collectible_hash],
-            manifest_table,
-        )
+        collectibles = manifest_index(manifest_table, _collectibles)
+        try:
+            return collectibles[collectible_hash]
+        except KeyError:
+            self = collectibles[collectible_hash] = cls(
+                manifest_table["DestinyCollectibleDefinition"][collectible_hash],
+                manifest_table,
+            )
+            return self
 
     def __init__(self, collectible_json: dict, manifest_table: dict):
-        self._json = collectible_json
+        self._manifest_table = manifest_table
         self.name = collectible_json.get("displayProperties", {}).get("name")
         self.description = collectible_json.get("displayProperties", {}).get(
             "description"
@@ -732,23 +1001,35 @@ class DestinyCollectible:
         self.hash = collectible_json.get("hash")
         self.collectible_index = collectible_json.get("index")
         self.collectible_item_hash = collectible_json.get("itemHash")
-        parent_node_hashes = collectible_json.get("parentNodeHashes")
-        self.parent_nodes = [
-            DestinyPresentationNode.from_node_hash(hash_, manifest_table)
-            for hash_ in parent_node_hashes
-        ]
+        self.parent_node_hashes: t.List[int] = (
+            collectible_json.get("parentNodeHashes") or []
+        )
+        self._parent_nodes: t.List[DestinyPresentationNode] | None = None
+
+    @property
+    def parent_nodes(self) -> t.List["DestinyPresentationNode"]:
+        if self._parent_nodes is None:
+            self._parent_nodes = [
+                DestinyPresentationNode.from_node_hash(hash_, self._manifest_table)
+                for hash_ in self.parent_node_hashes
+            ]
+        return self._parent_nodes
 
 
 class DestinyPresentationNode:
     @classmethod
     def from_node_hash(cls, node_hash: int, manifest_table: dict):
-        return cls(
-            manifest_table["DestinyPresentationNodeDefinition"][node_hash],
-            manifest_table,
-        )
+        presentation_nodes = manifest_index(manifest_table, _presentation_nodes)
+        try:
+            return presentation_nodes[node_hash]
+        except KeyError:
+            self = presentation_nodes[node_hash] = cls(
+                manifest_table["DestinyPresentationNodeDefinition"][node_hash],
+                manifest_table,
+            )
+            return self
 
     def __init__(self, node_json: dict, manifest_table: dict):
-        self._json = node_json
         self.name = node_json.get("displayProperties", {}).get("name")
         self.hash = node_json.get("hash")
 
@@ -766,6 +1047,29 @@ class DestinyVendor:
     ) -> t.Self:
         """Request a DestinyVendor object from the Bungie API.
 
+        Will raise a VendorNotFound exception if the vendor is not found."""
+        response = await cls.request_response_from_api(
+            access_token=access_token,
+            destiny_membership=destiny_membership,
+            character_id=character_id,
+            vendor_hash=vendor_hash,
+        )
+
+        return cls.from_vendors_api_response(
+            response=response,
+            manifest_table=manifest_table,
+            manifest_entry=manifest_entry,
+        )
+
+    @staticmethod
+    async def request_response_from_api(
+        access_token: str,
+        destiny_membership: DestinyMembership,
+        character_id: int,
+        vendor_hash: int = XUR_VENDOR_HASH,
+    ) -> dict:
+        """Request the raw vendor response from the Bungie API.
+
         Will raise a VendorNotFound exception if the vendor is not found."""
         async with aiohttp.ClientSession() as session:
             response = await session.get(
@@ -786,13 +1090,7 @@ class DestinyVendor:
             if response["ErrorCode"] == 1627:
                 raise VendorNotFound("Vendor not found", api_response=response)
 
-            response = response["Response"]
-
-        return cls.from_vendors_api_response(
-            response=response,
-            manifest_table=manifest_table,
-            manifest_entry=manifest_entry,
-        )
+            return response["Response"]
 
     @classmethod
     def from_vendors_api_response(
@@ -822,23 +1120,42 @@ class DestinyVendor:
             location = None
 
         _sale_items: dict = response["sales"]["data"]
-        # _plugs_for_sale_items: dict = response["itemComponents"]["reusablePlugs"][
-        #     "data"
-        # ]
+        _plugs_for_sale_items: dict = (
+            response["itemComponents"].get("reusablePlugs", {}).get("data", {})
+        )
         _stats_for_sale_items: dict = response["itemComponents"]["stats"]["data"]
         _perks_for_sale_items: dict = response["itemComponents"]["perks"]["data"]
 
-        destiny_items_for_sale = []
-        for _sale_item_key in _sale_items.keys():
-            # _plugs_for_sale_item = _plugs_for_sale_items.get(_sale_item_key, {})
-            _destiny_item_for_sale = DestinyItem.from_sale_item(
-                sale_item=_sale_items[_sale_item_key],
-                # reusable_plugs=_plugs_for_sale_item,
-                stats=_stats_for_sale_items.get(_sale_item_key, {}),
-                perks=_perks_for_sale_items.get(_sale_item_key, {}),
-                manifest_table=manifest_table,
+        _columns = _SaleItemColumns(
+            _sale_items,
+            _stats_for_sale_items,
+            _perks_for_sale_items,
+            manifest_table,
+            reusable_plugs=_plugs_for_sale_items,
+        )
+        destiny_items_for_sale = [
+            DestinyItem.from_sale_item_columns(_columns, row)
+            for row in range(len(_columns))
+        ]
+
+        # Weapons with reusable plugs list every perk option per socket
+        for row, item in enumerate(destiny_items_for_sale):
+            if item.is_weapon and _columns.plugs[row]:
+                item.with_plug_hashes(_columns.plugs[row], manifest_table)
+
+        # Armor the stats component has no stats for gets them from its rolled
+        # plugs and intrinsic stats, computed for the whole vendor at once
+        _armor_rows = [
+            row
+            for row, item in enumerate(destiny_items_for_sale)
+            if item.is_armor and _columns.plugs[row]
+        ]
+        if _armor_rows:
+            DestinyArmor.with_batched_reusable_plugs(
+                [destiny_items_for_sale[row] for row in _armor_rows],
+                [_columns.plugs[row] for row in _armor_rows],
+                manifest_table,
             )
-            destiny_items_for_sale.append(_destiny_item_for_sale)
 
         return cls(
             name=name,
@@ -971,14 +1288,25 @@ async def _wait_for_token_from_login(
     return _access_token
 
 
+# Reused access tokens stay valid for at least this long after they are handed out
+ACCESS_TOKEN_MIN_VALIDITY = dt.timedelta(minutes=5)
+
+
 async def refresh_api_tokens(
-    runner: aiohttp.web.AppRunner, with_login: bool = False
+    runner: aiohttp.web.AppRunner,
+    with_login: bool = False,
+    min_validity: dt.timedelta = ACCESS_TOKEN_MIN_VALIDITY,
 ) -> t.Coroutine[t.Any, t.Any, str]:
     if with_login:
         OAuthStateManager.clear_access_token()
         _access_token = await _wait_for_token_from_login(runner)
         return _access_token
 
+    # Reuse the access token from the last refresh while it stays valid for as
+    # long as the caller needs it
+    if _access_token := OAuthStateManager.get_access_token(min_validity):
+        return _access_token
+
     bungie_credentials = await schemas.BungieCredentials.get_credentials()
     if not bungie_credentials:
         raise ValueError("Bungie credentials are not set, please log in")
@@ -999,6 +1327,9 @@ async def refresh_api_tokens(
             _access_token = response_json["access_token"]
             _refresh_token = response_json["refresh_token"]
             _refresh_token_expires = response_json["refresh_expires_in"]
+            OAuthStateManager.set_access_token(
+                _access_token, response_json["expires_in"]
+            )
 
     await schemas.BungieCredentials.set_refresh_token(
         refresh_token=_refresh_token,
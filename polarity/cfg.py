@@ -152,6 +152,8 @@ gsheets_credentials = _sheets_credentials(
     "SHEETS_CLIENT_X509_CERT_URL",
 )
 sheets_ls_url = _getenv("SHEETS_LS_URL")
+# Seconds before sheet data is refreshed in the background
+sheets_ttl = int(_getenv("SHEETS_TTL", 300))
 
 # Bungie credentials
 bungie_api_key = _getenv("BUNGIE_API_KEY")
@@ -21,44 +21,66 @@ import lightbulb as lb
 import miru as m
 import regex as re
 
-from . import cfg
+from . import cfg, emojis
 from .utils import follow_link_single_step
 
 re_user_side_emoji = re.compile("(<a?)?:(\w+)(~\d)*:(\d+>)?")
 
 
-def construct_emoji_substituter(
-    emoji_dict: t.Dict[str, h.Emoji],
-) -> t.Callable[[re.Match], str]:
-    """Constructs a substituter for user-side emoji to be used in re.sub"""
+class EmojiSubstituter:
+    """Substitutes user-side emoji with their mentions, compiled for one emoji set
 
-    def func(match: re.Match) -> str:
-        maybe_emoji_name = str(match.group(2))
-        return str(
-            emoji_dict.get(maybe_emoji_name)
-            or emoji_dict.get(maybe_emoji_name.lower())
-            or match.group(0)
-        )
+    Mentions are rendered once up front, under both their names and lowercase
+    aliases, so each match costs a single dict lookup. Static text, such as post
+    headers and footers, is substituted once and memoized."""
+
+    def __init__(self, emoji_dict: t.Mapping[str, h.Emoji]):
+        mentions: t.Dict[str, str] = {}
+        for name, emoji in emoji_dict.items():
+            mentions.setdefault(name.lower(), str(emoji))
+        # Exact names take precedence over lowercase aliases
+        for name, emoji in emoji_dict.items():
+            mentions[name] = str(emoji)
+
+        self._mentions = mentions
+        self._static_text: t.Dict[str, str] = {}
 
-    return func
+    def _replace(self, match: re.Match) -> str:
+        maybe_emoji_name = match.group(2)
+        mention = self._mentions.get(maybe_emoji_name)
+        if mention is None:
+            mention = self._mentions.get(maybe_emoji_name.lower(), match.group(0))
+        return mention
+
+    def substitute(self, text: str) -> str:
+        return re_user_side_emoji.sub(self._replace, text)
+
+    def substitute_static(self, text: str) -> str:
+        """Substitutes text that is the same on every render, memoizing the result"""
+        try:
+            return self._static_text[text]
+        except KeyError:
+            substituted = self._static_text[text] = self.substitute(text)
+            return substituted
+
+
+def compile_emoji_substituter(emoji_dict: t.Mapping[str, h.Emoji]) -> EmojiSubstituter:
+    """Returns a substituter for these emojis, compiled once per registry version"""
+    return emojis.emoji_index(emoji_dict, EmojiSubstituter)
 
 
 async def substitute_user_side_emoji(
-    bot_or_emoji_dict: lb.BotApp | t.Dict[str, h.Emoji], text: str
+    bot_or_emoji_dict: lb.BotApp | t.Mapping[str, h.Emoji], text: str
 ) -> str:
     """Substitutes user-side emoji with their respective mentions"""
 
     if isinstance(bot_or_emoji_dict, h.GatewayBot):
-        guild = bot_or_emoji_dict.cache.get_guild(
-            cfg.kyber_discord_server_id
-        ) or await bot_or_emoji_dict.rest.fetch_guild(cfg.kyber_discord_server_id)
-
-        emoji_dict = {emoji.name: emoji for emoji in await guild.fetch_emojis()}
+        emoji_dict = await emojis.get_emoji_registry(bot_or_emoji_dict)
     else:
         emoji_dict = bot_or_emoji_dict
 
     # Substitutes user-side emoji with their respective mentions
-    return re_user_side_emoji.sub(construct_emoji_substituter(emoji_dict), text)
+    return compile_emoji_substituter(emoji_dict).substitute(text)
 
 
 class InteractiveBuilderView(m.View):
@@ -0,0 +1,188 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import logging
+import typing as t
+from pathlib import Path
+
+import hikari as h
+import lightbulb as lb
+
+from . import cfg
+
+logger = logging.getLogger(__name__)
+
+EMOJI_CACHE_PATH = Path("cache") / "emojis.json"
+
+_T = t.TypeVar("_T")
+
+
+class EmojiRegistry(t.Mapping[str, h.CustomEmoji]):
+    """The custom emojis of a guild, kept up to date from gateway events
+
+    Behaves as a read only mapping from emoji name to emoji. `version` increases
+    whenever the emojis change, so anything derived from them can tell when it is
+    out of date. The emojis are persisted to disk so that they are available
+    without a REST call straight after a restart."""
+
+    def __init__(self, guild_id: int, path: Path = EMOJI_CACHE_PATH):
+        self.guild_id = guild_id
+        self.path = path
+        self.version = 0
+        self._emojis: t.Dict[str, h.CustomEmoji] = {}
+        self._lowercase_emojis: t.Dict[str, h.CustomEmoji] = {}
+        self.indexes: t.Dict[t.Callable[[t.Mapping], t.Any], t.Any] = {}
+
+    def __getitem__(self, name: str) -> h.CustomEmoji:
+        return self._emojis[name]
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self._emojis)
+
+    def __len__(self) -> int:
+        return len(self._emojis)
+
+    def lookup(self, name: str) -> h.CustomEmoji | None:
+        """Returns the emoji with this name, ignoring case if there is no exact
+        match"""
+        return self._emojis.get(name) or self._lowercase_emojis.get(name.lower())
+
+    @staticmethod
+    def _emoji_key(emoji: h.CustomEmoji) -> t.Tuple[int, str, bool]:
+        return int(emoji.id), emoji.name, emoji.is_animated
+
+    def update(self, emojis: t.Iterable[h.CustomEmoji]) -> bool:
+        """Replaces the emojis in the registry
+
+        Returns True if the emojis changed, in which case `version` is bumped"""
+        emojis = {emoji.name: emoji for emoji in emojis}
+        if sorted(map(self._emoji_key, emojis.values())) == sorted(
+            map(self._emoji_key, self._emojis.values())
+        ):
+            return False
+
+        lowercase_emojis: t.Dict[str, h.CustomEmoji] = {}
+        for name, emoji in emojis.items():
+            lowercase_emojis.setdefault(name.lower(), emoji)
+
+        self._emojis = emojis
+        self._lowercase_emojis = lowercase_emojis
+        self.indexes = {}
+        self.version += 1
+        return True
+
+    def load(self) -> bool:
+        """Loads the emojis persisted on disk, if any"""
+        try:
+            with open(self.path) as f:
+                persisted = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if persisted.get("guild_id") != self.guild_id:
+            return False
+
+        return self.update(
+            h.CustomEmoji(
+                id=h.Snowflake(emoji["id"]),
+                name=emoji["name"],
+                is_animated=emoji["animated"],
+            )
+            for emoji in persisted["emojis"]
+        )
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(
+                {
+                    "guild_id": self.guild_id,
+                    "emojis": [
+                        {
+                            "id": int(emoji.id),
+                            "name": name,
+                            "animated": emoji.is_animated,
+                        }
+                        for name, emoji in self._emojis.items()
+                    ],
+                },
+                f,
+            )
+
+    def update_and_save(self, emojis: t.Iterable[h.CustomEmoji]) -> bool:
+        changed = self.update(emojis)
+        if changed:
+            try:
+                self.save()
+            except OSError as e:
+                e.add_note("Failed to persist emojis\n")
+                logger.exception(e)
+        return changed
+
+    async def fetch(self, bot: lb.BotApp) -> bool:
+        """Updates the registry with the guild's emojis from the REST API"""
+        return self.update_and_save(await bot.rest.fetch_guild_emojis(self.guild_id))
+
+
+def emoji_index(
+    emoji_dict: t.Mapping[str, h.Emoji], builder: t.Callable[[t.Mapping], _T]
+) -> _T:
+    """Returns the index built by `builder` for these emojis
+
+    The index is memoized until the emojis change if `emoji_dict` is an
+    EmojiRegistry, and rebuilt on every call otherwise."""
+    if not isinstance(emoji_dict, EmojiRegistry):
+        return builder(emoji_dict)
+
+    try:
+        return emoji_dict.indexes[builder]
+    except KeyError:
+        index = emoji_dict.indexes[builder] = builder(emoji_dict)
+        return index
+
+
+async def get_emoji_registry(bot: lb.BotApp) -> EmojiRegistry:
+    """Returns the bot's emoji registry, fetching the emojis if there are none yet"""
+    registry: EmojiRegistry = bot.d.emoji_registry
+    if not registry.version:
+        await registry.fetch(bot)
+    return registry
+
+
+async def on_start_fetch_emojis(event: lb.LightbulbStartedEvent):
+    registry: EmojiRegistry = event.app.d.emoji_registry
+    try:
+        await registry.fetch(event.app)
+    except Exception as e:
+        e.add_note("Failed to fetch emojis, using emojis persisted on disk\n")
+        logger.exception(e)
+
+
+async def on_emojis_update(event: h.EmojisUpdateEvent):
+    registry: EmojiRegistry = event.app.d.emoji_registry
+    if event.guild_id != registry.guild_id:
+        return
+
+    if registry.update_and_save(event.emojis):
+        logger.info(f"Emojis updated to version {registry.version}")
+
+
+def register(bot: lb.BotApp) -> None:
+    bot.d.emoji_registry = EmojiRegistry(cfg.kyber_discord_server_id)
+    bot.d.emoji_registry.load()
+
+    bot.listen(lb.LightbulbStartedEvent)(on_start_fetch_emojis)
+    bot.listen(h.EmojisUpdateEvent)(on_emojis_update)
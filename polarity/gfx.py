@@ -0,0 +1,252 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio as aio
+import collections
+import datetime as dt
+import hashlib
+import json
+import logging
+import typing as t
+from pathlib import Path
+
+import aiocron
+import hikari as h
+import lightbulb as lb
+from aiohttp import InvalidURL
+
+from . import cfg, ls_rotation, utils
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_PATH = Path("cache") / "images"
+IMAGE_CACHE_LINKS_PATH = Path("cache") / "image_links.json"
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ImageCache:
+    """Linked images stored on disk under the hash of their content
+
+    Images are looked up by the link they were fetched from. Links to the same
+    image share one file. Once the files exceed `max_bytes`, the least recently
+    used are deleted. `version` increases whenever the cached images change. The
+    links are persisted to `links_path` so that cached images are found without
+    a download straight after a restart."""
+
+    def __init__(
+        self,
+        path: Path = IMAGE_CACHE_PATH,
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+        links_path: Path = IMAGE_CACHE_LINKS_PATH,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.links_path = links_path
+        self.version = 0
+        self._links: t.Dict[str, str] = {}
+        # File name -> size, least recently used first
+        self._files: collections.OrderedDict[str, int] = collections.OrderedDict()
+        self._pending: t.Dict[str, aio.Task] = {}
+
+    @property
+    def size(self) -> int:
+        return sum(self._files.values())
+
+    def load(self):
+        """Accounts for the files already on disk, oldest first, along with the
+        persisted links to them"""
+        if not self.path.is_dir():
+            return
+        for file in sorted(self.path.iterdir(), key=lambda file: file.stat().st_mtime):
+            self._files[file.name] = file.stat().st_size
+
+        try:
+            with open(self.links_path) as f:
+                links: t.Dict[str, str] = json.load(f)
+        except (OSError, ValueError):
+            links = {}
+        self._links = {
+            link: name for link, name in links.items() if name in self._files
+        }
+        self._evict()
+
+    def save(self):
+        self.links_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.links_path, "w") as f:
+            json.dump(self._links, f)
+
+    def _save_links(self):
+        try:
+            self.save()
+        except OSError as e:
+            e.add_note("Failed to persist image cache links\n")
+            logger.exception(e)
+
+    def _evict(self):
+        # Always keep the newest file, even if it alone is over the cap
+        while self.size > self.max_bytes and len(self._files) > 1:
+            name, _ = self._files.popitem(last=False)
+            (self.path / name).unlink(missing_ok=True)
+            self._links = {
+                link: name_ for link, name_ in self._links.items() if name_ != name
+            }
+            self.version += 1
+            logger.info(f"Evicted {name} from the image cache")
+
+    def get(self, link: str) -> Path | None:
+        """Returns the cached file of a link, marking it recently used"""
+        name = self._links.get(link)
+        if name is None or name not in self._files:
+            return None
+        self._files.move_to_end(name)
+        return self.path / name
+
+    def _add(self, link: str, name: str, size: int):
+        self._files[name] = size
+        self._files.move_to_end(name)
+        self._links[link] = name
+        self.version += 1
+        self._evict()
+        self._save_links()
+
+    def _write(self, name: str, content: bytes):
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / name).write_bytes(content)
+
+    async def _fetch(self, link: str) -> Path | None:
+        try:
+            image = await utils.fetch_linked_image(link)
+            if image is None:
+                logger.warning(f"Could not download image {link}")
+                return None
+
+            image_name, content = image
+            name = hashlib.sha256(content).hexdigest() + Path(image_name).suffix
+            if name not in self._files:
+                await aio.get_event_loop().run_in_executor(
+                    None, self._write, name, content
+                )
+            self._add(link, name, len(content))
+            return self.path / name
+        finally:
+            self._pending.pop(link, None)
+
+    async def fetch(self, link: str) -> Path | None:
+        """Downloads a linked image into the cache, returning its file
+
+        Concurrent fetches of the same link share one download"""
+        if link not in self._pending:
+            self._pending[link] = aio.create_task(self._fetch(link))
+        return await aio.shield(self._pending[link])
+
+    async def attachment(self, link: str) -> h.Bytes | None:
+        """Returns the cached image of a link as an attachment, if cached
+
+        The image is read into memory, so the attachment stays valid if the file
+        is evicted before it is sent. It keeps the file's content addressed name"""
+        file = self.get(link)
+        if file is None:
+            return None
+        try:
+            content = await aio.get_event_loop().run_in_executor(None, file.read_bytes)
+        except OSError:
+            # Evicted since it was looked up
+            return None
+        return h.Bytes(content, file.name)
+
+
+image_cache = ImageCache()
+
+
+def default_gfx_links() -> t.List[str]:
+    return [cfg.defaults.xur.gfx_url, cfg.defaults.weekly_reset.gfx_url]
+
+
+def upcoming_ls_gfx_links(days: int = 2) -> t.List[str]:
+    """Returns the graphic shortlinks of today's lost sector onwards, for the
+    days in the rotation store"""
+    today = ls_rotation.rotation_day()
+    links = []
+    for offset in range(days):
+        sector = ls_rotation.store.sector_for(today + dt.timedelta(days=offset))
+        if sector is not None and sector.shortlink_gfx:
+            links.append(sector.shortlink_gfx)
+    return links
+
+
+async def prefetch_redirects(links: t.Iterable[str]) -> t.Dict[str, str | None]:
+    """Resolves links into the redirect cache ahead of their use"""
+    links = list(dict.fromkeys(links))
+    results = await aio.gather(
+        *(utils.redirect_cache.resolve(link, refresh=True) for link in links),
+        return_exceptions=True,
+    )
+
+    resolved = {}
+    for link, result in zip(links, results):
+        if isinstance(result, InvalidURL):
+            logger.warning(f"Not prefetching invalid gfx link {link}")
+        elif isinstance(result, Exception):
+            logger.exception(result)
+        else:
+            resolved[link] = result
+    return resolved
+
+
+async def prefetch_images(links: t.Iterable[str]) -> int:
+    """Downloads linked images into the image cache ahead of their use"""
+    links = list(dict.fromkeys(links))
+    results = await aio.gather(
+        *(image_cache.fetch(link) for link in links), return_exceptions=True
+    )
+
+    for result in results:
+        if isinstance(result, Exception):
+            logger.exception(result)
+    return sum(isinstance(result, Path) for result in results)
+
+
+async def prefetch_gfx():
+    ls_gfx_links = upcoming_ls_gfx_links()
+    resolved = await prefetch_redirects(ls_gfx_links + default_gfx_links())
+    logger.info(
+        f"Prefetched {sum(v is not None for v in resolved.values())}"
+        + f" of {len(resolved)} gfx redirects"
+    )
+
+    # Lost sector posts attach their graphic, keep it ready on disk
+    ls_gfx_urls = [resolved[link] for link in ls_gfx_links if resolved.get(link)]
+    downloaded = await prefetch_images(ls_gfx_urls)
+    logger.info(f"Prefetched {downloaded} of {len(ls_gfx_urls)} lost sector images")
+
+
+async def on_start_prefetch_gfx(event: lb.LightbulbStartedEvent):
+    image_cache.load()
+    await prefetch_gfx()
+
+    # Hourly, so cached redirects never expire before a post. Runs after the
+    # rotation sync at half past to pick up sheet edits
+    @aiocron.crontab("45 * * * *", start=True)
+    async def hourly_gfx_prefetch():
+        await prefetch_gfx()
+
+
+async def on_stopping_close_session(event: h.StoppingEvent):
+    await utils.redirect_cache.close()
+
+
+def register(bot: lb.BotApp) -> None:
+    bot.listen(lb.LightbulbStartedEvent)(on_start_prefetch_gfx)
+    bot.listen(h.StoppingEvent)(on_stopping_close_session)
@@ -0,0 +1,275 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio as aio
+import bisect
+import collections
+import logging
+import typing as t
+import unicodedata
+
+import aiocron
+import hikari as h
+import lightbulb as lb
+
+from . import bungie_api as api
+from . import cfg
+
+logger = logging.getLogger(__name__)
+
+# Discord allows at most 25 autocomplete choices
+MAX_AUTOCOMPLETE_CHOICES = 25
+# Share of a query's trigrams a name must contain to be a fuzzy match
+MIN_TRIGRAM_SCORE = 0.5
+
+
+def normalize_name(name: str) -> str:
+    """Casefolds a name and strips its accents, so that "xur" matches "Xûr" """
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return " ".join(
+        "".join(char for char in decomposed if not unicodedata.combining(char)).split()
+    )
+
+
+def _trigrams(normalized_name: str) -> t.Set[str]:
+    padded = f"  {normalized_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class ItemSearchIndex:
+    """Name search over the items in a manifest, built once per manifest version
+
+    Weapons, armor and collectible items are indexed by name, keeping one item per
+    name. Prefixes of a name, or of any word in it, are looked up by bisecting a
+    sorted list of keys, and names that do not match on a prefix fall back to a
+    trigram index so that typos still find the item."""
+
+    def __init__(self, manifest_table: dict):
+        items_by_name: t.Dict[str, dict] = {}
+        for item in manifest_table["DestinyInventoryItemDefinition"].values():
+            name = item.get("displayProperties", {}).get("name")
+            if not name or not (
+                item.get("collectibleHash")
+                or item.get("itemType")
+                in (api.DESTINY_ITEM_TYPE_WEAPON, api.DESTINY_ITEM_TYPE_ARMOR)
+            ):
+                continue
+
+            normalized_name = normalize_name(name)
+            # Prefer the item with a collectible, that is the one players own
+            existing = items_by_name.get(normalized_name)
+            if existing is None or (
+                item.get("collectibleHash") and not existing.get("collectibleHash")
+            ):
+                items_by_name[normalized_name] = item
+
+        self.items: t.List[dict] = list(items_by_name.values())
+        self.names: t.List[str] = list(items_by_name.keys())
+
+        keys: t.List[t.Tuple[str, int]] = []
+        trigram_postings: t.Dict[str, t.List[int]] = collections.defaultdict(list)
+        for id_, normalized_name in enumerate(self.names):
+            words = normalized_name.split(" ")
+            for word_index in range(len(words)):
+                keys.append((" ".join(words[word_index:]), id_))
+            for trigram in _trigrams(normalized_name):
+                trigram_postings[trigram].append(id_)
+
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._key_ids = [id_ for _, id_ in keys]
+        self._trigram_postings = dict(trigram_postings)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _prefix_matches(self, query: str, limit: int) -> t.List[int]:
+        ids: t.Dict[int, None] = {}
+        position = bisect.bisect_left(self._keys, query)
+        while (
+            len(ids) < limit
+            and position < len(self._keys)
+            and self._keys[position].startswith(query)
+        ):
+            ids[self._key_ids[position]] = None
+            position += 1
+        # Names that start with the query come before those with a word that does
+        return sorted(ids, key=lambda id_: not self.names[id_].startswith(query))
+
+    def _trigram_matches(self, query: str, limit: int) -> t.List[int]:
+        query_trigrams = _trigrams(query)
+        hits = collections.Counter()
+        for trigram in query_trigrams:
+            hits.update(self._trigram_postings.get(trigram, ()))
+
+        min_hits = MIN_TRIGRAM_SCORE * len(query_trigrams)
+        return [id_ for id_, count in hits.most_common(limit * 4) if count >= min_hits][
+            :limit
+        ]
+
+    def search(self, query: str, limit: int = MAX_AUTOCOMPLETE_CHOICES) -> t.List[dict]:
+        """Returns the manifest entries of items best matching the query"""
+        query = normalize_name(query)
+        if not query:
+            return []
+
+        ids = self._prefix_matches(query, limit)
+        if len(ids) < limit:
+            ids += [
+                id_ for id_ in self._trigram_matches(query, limit) if id_ not in ids
+            ][: limit - len(ids)]
+
+        return [self.items[id_] for id_ in ids]
+
+
+def _item_search_index(manifest_table: dict) -> ItemSearchIndex:
+    return ItemSearchIndex(manifest_table)
+
+
+async def update_item_search_index(bot: lb.BotApp):
+    manifest_table = await api.get_manifest_table()
+    # Building the index takes a moment, keep the event loop free meanwhile
+    bot.d.item_search_index = await aio.get_event_loop().run_in_executor(
+        None, api.manifest_index, manifest_table, _item_search_index
+    )
+    bot.d.item_manifest_table = manifest_table
+    logger.info(f"Item search index ready with {len(bot.d.item_search_index)} items")
+
+
+def _item_choice_name(item: dict) -> str:
+    name = item["displayProperties"]["name"]
+    item_type = item.get("itemTypeDisplayName")
+    return (f"{name} ({item_type})" if item_type else name)[:100]
+
+
+async def item_name_autocomplete(
+    option: h.AutocompleteInteractionOption,
+    interaction: h.AutocompleteInteraction,
+) -> t.List[h.CommandChoice]:
+    bot: lb.BotApp = interaction.app
+    index: ItemSearchIndex | None = bot.d.get("item_search_index")
+    if index is None:
+        return []
+
+    return [
+        h.CommandChoice(name=_item_choice_name(item), value=str(item["hash"]))
+        for item in index.search(str(option.value or ""))
+    ]
+
+
+def resolve_item(bot: lb.BotApp, name: str) -> dict | None:
+    """Returns the manifest entry of an item option value
+
+    Autocompleted choices are item hashes, anything else is searched by name"""
+    index: ItemSearchIndex | None = bot.d.get("item_search_index")
+    if index is None:
+        return None
+
+    item = (
+        bot.d.item_manifest_table["DestinyInventoryItemDefinition"].get(int(name))
+        if name.isdigit()
+        else None
+    )
+    if item is None:
+        matches = index.search(name, limit=1)
+        item = matches[0] if matches else None
+    return item
+
+
+def item_name(bot: lb.BotApp, item_hash: int) -> str:
+    """Returns the name of an item, or its hash if the manifest is not loaded"""
+    manifest_table: dict | None = bot.d.get("item_manifest_table")
+    item = (
+        manifest_table["DestinyInventoryItemDefinition"].get(item_hash)
+        if manifest_table
+        else None
+    )
+    return item["displayProperties"]["name"] if item else str(item_hash)
+
+
+def item_embed(item: dict) -> h.Embed:
+    display_properties = item["displayProperties"]
+    lightgg_url = f"https://light.gg/db/items/{item['hash']}"
+
+    class_type = item.get("classType", 3)
+    details = [
+        item.get("inventory", {}).get("tierTypeName"),
+        item.get("itemTypeDisplayName"),
+        (
+            api.DESTINY_CLASSES_ENUM[class_type]
+            if class_type < len(api.DESTINY_CLASSES_ENUM)
+            else None
+        ),
+    ]
+
+    embed = h.Embed(
+        title=display_properties["name"],
+        description=" • ".join(filter(None, details))
+        + (f"\n\n*{item['flavorText']}*" if item.get("flavorText") else "")
+        + f"\n\n[View on light.gg]({lightgg_url}) ↗",
+        url=lightgg_url,
+        color=cfg.embed_default_color,
+    )
+    if display_properties.get("icon"):
+        embed.set_thumbnail(api.BUNGIE_NET + display_properties["icon"])
+    return embed
+
+
+@lb.option(
+    "name",
+    "Name of the item",
+    str,
+    required=True,
+    autocomplete=item_name_autocomplete,
+)
+@lb.command("item", "Look up a Destiny 2 item", pass_options=True)
+@lb.implements(lb.SlashCommand)
+async def item_command(ctx: lb.Context, name: str):
+    """Look up an item by name and link it on light.gg"""
+    index: ItemSearchIndex | None = ctx.bot.d.get("item_search_index")
+    if index is None:
+        await ctx.respond(
+            "Item search is still loading, please try again shortly",
+            flags=h.MessageFlag.EPHEMERAL,
+        )
+        return
+
+    item = resolve_item(ctx.bot, name)
+    if item is None:
+        await ctx.respond(
+            f"No item found matching '{name}'", flags=h.MessageFlag.EPHEMERAL
+        )
+        return
+
+    await ctx.respond(embed=item_embed(item))
+
+
+async def on_start_build_item_search_index(event: lb.LightbulbStartedEvent):
+    bot: lb.BotApp = event.app
+    try:
+        await update_item_search_index(bot)
+    except Exception as e:
+        e.add_note("Failed to build the item search index\n")
+        logger.exception(e)
+
+    # New manifests usually ship at reset, rebuild the index shortly after
+    @aiocron.crontab("15 17 * * *", start=True)
+    async def refresh_item_search_index():
+        await update_item_search_index(bot)
+
+
+def register(bot: lb.BotApp) -> None:
+    bot.command(item_command)
+    bot.listen(lb.LightbulbStartedEvent)(on_start_build_item_search_index)
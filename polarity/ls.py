@@ -14,6 +14,7 @@
 # mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio as aio
+import datetime as dt
 import logging
 import typing as t
 
@@ -22,15 +23,10 @@ import hikari as h
 import lightbulb as lb
 from aiohttp import InvalidURL
 from hmessage import HMessage
-from sector_accounting.sector_accounting import (
-    DifficultySpecificSectorData,
-    Rotation,
-    Sector,
-)
 
-from . import cfg, schemas, utils
+from . import cfg, emojis, gfx, ls_rotation, render, schemas, utils
 from .autopost import make_autopost_control_commands
-from .embeds import construct_emoji_substituter, re_user_side_emoji
+from .embeds import compile_emoji_substituter
 
 logger = logging.getLogger(__name__)
 
@@ -46,8 +42,8 @@ def _fmt_count(emoji: str, count: int, width: int) -> str:
 
 
 def format_counts(
-    legend_data: DifficultySpecificSectorData,
-    master_data: DifficultySpecificSectorData,
+    legend_data: ls_rotation.SectorDifficulty,
+    master_data: ls_rotation.SectorDifficulty,
     emoji_dict: t.Dict[str, h.Emoji],
 ) -> str:
     len_bar = len(
@@ -131,34 +127,32 @@ def format_counts(
     )
 
 
-async def get_emoji_dict(bot: lb.BotApp):
-    guild = bot.cache.get_guild(
-        cfg.kyber_discord_server_id
-    ) or await bot.rest.fetch_guild(cfg.kyber_discord_server_id)
-    return {emoji.name: emoji for emoji in await guild.fetch_emojis()}
+async def get_emoji_dict(bot: lb.BotApp) -> emojis.EmojiRegistry:
+    return await emojis.get_emoji_registry(bot)
 
 
-async def format_sector(
-    bot: lb.BotApp,
-) -> HMessage:
-    emoji_dict = await get_emoji_dict(bot)
-    sector: Sector = Rotation.from_gspread_url(
-        cfg.sheets_ls_url, cfg.gsheets_credentials, buffer=5
-    )()
-
+async def sector_gfx_url(sector: ls_rotation.StoredSector) -> str | None:
+    """Returns where the graphic shortlink of a sector leads, if it resolves"""
     # Follow the hyperlink to have the newest image embedded
     try:
-        ls_gfx_url = await utils.follow_link_single_step(sector.shortlink_gfx)
+        return await utils.follow_link_single_step(sector.shortlink_gfx)
     except InvalidURL:
-        ls_gfx_url = None
+        return None
+
+
+async def format_sector(bot: lb.BotApp, day: dt.date | None = None) -> HMessage:
+    """Formats the lost sector post of a rotation day, today's by default"""
+    emoji_dict = await get_emoji_dict(bot)
+    sector = await ls_rotation.current_sector(day)
+    ls_gfx_url = await sector_gfx_url(sector)
 
     # Surges to emojis
     surges = []
     for surge in sector.surges:
-        surges += [str(emoji_dict.get(surge) or emoji_dict.get(surge.lower()))]
+        surges += [str(emoji_dict.lookup(surge))]
 
     # Threat to emoji
-    threat = emoji_dict.get(sector.threat) or emoji_dict.get(sector.threat.lower())
+    threat = emoji_dict.lookup(sector.threat)
 
     overcharged_weapon_emoji = (
         "⚔️" if sector.overcharged_weapon.lower() in ["sword", "glaive"] else "🔫"
@@ -174,8 +168,8 @@ async def format_sector(
     # Legendary weapon rewards
     legendary_weapon_rewards = sector.legendary_rewards
 
-    legendary_weapon_rewards = re_user_side_emoji.sub(
-        construct_emoji_substituter(emoji_dict), legendary_weapon_rewards
+    legendary_weapon_rewards = compile_emoji_substituter(emoji_dict).substitute(
+        legendary_weapon_rewards
     )
 
     embed = h.Embed(
@@ -222,16 +216,49 @@ async def format_sector(
     embed.add_field(
         name="Modifiers",
         value=str(emoji_dict["swords"])
-        + f"{utils.space.three_per_em}{sector.to_sector_v1().modifiers}"
+        + f"{utils.space.three_per_em}{sector.modifiers}"
         + f"\n{overcharged_weapon_emoji}{utils.space.three_per_em}Overcharged {sector.overcharged_weapon}",
     )
 
     if ls_gfx_url:
-        embed.set_image(ls_gfx_url)
+        # Attach the graphic when it is cached so followers load it from Discord
+        embed.set_image(await gfx.image_cache.attachment(ls_gfx_url) or ls_gfx_url)
 
     return HMessage(embeds=[embed])
 
 
+# Lost sector previews are rendered concurrently, at most this many at a time
+PREVIEW_CONCURRENCY = 3
+MAX_PREVIEW_DAYS = 14
+
+_render_cache = render.RenderCache(maxsize=MAX_PREVIEW_DAYS + 2)
+
+
+async def cached_format_sector(bot: lb.BotApp, day: dt.date | None = None) -> HMessage:
+    """Returns the lost sector post, reusing the last render if none of its inputs
+    changed
+
+    Renders are keyed by the rotation day along with the rotation store, emoji and
+    image cache versions, the legendary weapons setting and where the graphic
+    link resolves to, so a render missing its graphic is not reused once the
+    link resolves."""
+    emoji_registry = await emojis.get_emoji_registry(bot)
+    legendary_weapons_enabled = (
+        await schemas.AutoPostSettings.get_lost_sector_legendary_weapons_enabled()
+    )
+    fingerprint = (
+        day or ls_rotation.rotation_day(),
+        ls_rotation.store.version,
+        emoji_registry.version,
+        gfx.image_cache.version,
+        legendary_weapons_enabled,
+        await sector_gfx_url(await ls_rotation.current_sector(day)),
+    )
+    return await _render_cache.get_or_render(
+        fingerprint, lambda: format_sector(bot, day)
+    )
+
+
 async def discord_announcer(
     bot: lb.BotApp,
     channel_id: int,
@@ -295,6 +322,57 @@ async def control_legendary_weapons(ctx: lb.Context, option: str):
     )
 
 
+async def render_previews(
+    bot: lb.BotApp, days: t.Sequence[dt.date]
+) -> t.List[HMessage | Exception]:
+    """Renders the lost sector posts of several days, failures included in place"""
+    semaphore = aio.Semaphore(PREVIEW_CONCURRENCY)
+
+    async def render_preview(day: dt.date) -> HMessage:
+        async with semaphore:
+            return await cached_format_sector(bot, day)
+
+    return await aio.gather(
+        *(render_preview(day) for day in days), return_exceptions=True
+    )
+
+
+@lb.option(
+    "days",
+    "Number of days to preview, starting today",
+    int,
+    min_value=1,
+    max_value=MAX_PREVIEW_DAYS,
+    default=2,
+)
+@lb.command(
+    "preview",
+    "Check the lost sector posts of the coming days",
+    auto_defer=True,
+    pass_options=True,
+)
+@lb.implements(lb.SlashSubCommand)
+@utils.check_admin
+async def ls_preview(ctx: lb.Context, days: int):
+    """Preview upcoming lost sector posts to catch mistakes before they go out"""
+    today = ls_rotation.rotation_day()
+    preview_days = [today + dt.timedelta(days=offset) for offset in range(days)]
+
+    await ctx.respond(f"Previewing the next {days} lost sector posts")
+    for day, preview in zip(preview_days, await render_previews(ctx.app, preview_days)):
+        day_mention = f"<t:{int(ls_rotation.rotation_start(day).timestamp())}:D>"
+        if isinstance(preview, Exception):
+            logger.exception(preview)
+            await ctx.respond(f"**{day_mention}**: Could not render, {preview}")
+            continue
+
+        message_kwargs = preview.to_message_kwargs()
+        message_kwargs["content"] = f"**{day_mention}**\n" + (
+            message_kwargs.get("content") or ""
+        )
+        await ctx.respond(**message_kwargs)
+
+
 def sub_group(parent: lb.CommandLike, name: str, description: str):
     @lb.command(name, description)
     @lb.implements(lb.SlashSubGroup)
@@ -328,9 +406,14 @@ async def ls_update(ctx: lb.MessageContext):
 
         await ctx.edit_last_response("Updating post now")
 
+        # Pick up any corrections made to the rotation sheet
+        await ls_rotation.sync_rotation()
+
         message = await format_sector(ctx.app)
-        await msg_to_update.edit(**message.to_message_kwargs())
-        await ctx.edit_last_response("Post updated")
+        if await utils.message_editor.edit(msg_to_update, message):
+            await ctx.edit_last_response("Post updated")
+        else:
+            await ctx.edit_last_response("Post already up to date")
 
 
 async def on_start_schedule_autoposts(event: lb.LightbulbStartedEvent):
@@ -354,11 +437,12 @@ def register(bot: lb.BotApp) -> None:
         schemas.AutoPostSettings.get_lost_sector_enabled,
         schemas.AutoPostSettings.set_lost_sector,
         cfg.followables["lost_sector"],
-        format_sector,
+        cached_format_sector,
         message_announcer_coro=discord_announcer,
     )
 
     autopost_control_parent_group.child(control_legendary_weapons)
+    autopost_control_parent_group.child(ls_preview)
 
     bot.command(autopost_control_parent_group)
 
@@ -0,0 +1,331 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio as aio
+import datetime as dt
+import json
+import logging
+import typing as t
+import zlib
+
+import aiocron
+import attr
+import lightbulb as lb
+from sector_accounting.sector_accounting import (
+    DifficultySpecificSectorData,
+    Rotation,
+    Sector,
+)
+
+from . import schemas, sheets
+
+logger = logging.getLogger(__name__)
+
+# Days of the rotation mirrored ahead of today, enough to cover a season
+ROTATION_STORE_DAYS = 120
+
+
+def rotation_day(now: dt.datetime | None = None) -> dt.date:
+    """Returns the day whose lost sector is active at `now`
+
+    Lost sectors rotate at 1700 UTC, so earlier times belong to the day before"""
+    if now is None:
+        now = dt.datetime.now(tz=dt.timezone.utc)
+    return (now - dt.timedelta(hours=17)).date()
+
+
+def rotation_start(day: dt.date) -> dt.datetime:
+    """Returns the time at which the lost sector of a rotation day goes live"""
+    return dt.datetime.combine(day, dt.time(17), tzinfo=dt.timezone.utc)
+
+
+def _rotation_midpoint(day: dt.date) -> dt.datetime:
+    # Midway between the resets that bound the day, clear of any reset buffer
+    return rotation_start(day) + dt.timedelta(hours=12)
+
+
+@attr.s(frozen=True)
+class SectorDifficulty:
+    """Champion and shield counts of a lost sector at one difficulty"""
+
+    barrier_champions: int = attr.ib()
+    overload_champions: int = attr.ib()
+    unstoppable_champions: int = attr.ib()
+    arc_shields: int = attr.ib()
+    void_shields: int = attr.ib()
+    solar_shields: int = attr.ib()
+    stasis_shields: int = attr.ib()
+    strand_shields: int = attr.ib()
+
+    @classmethod
+    def from_difficulty_data(cls, data: DifficultySpecificSectorData) -> t.Self:
+        return cls(
+            **{field.name: getattr(data, field.name) for field in attr.fields(cls)}
+        )
+
+
+def _to_sector_difficulty(value: dict | SectorDifficulty) -> SectorDifficulty:
+    return SectorDifficulty(**value) if isinstance(value, dict) else value
+
+
+@attr.s(frozen=True)
+class StoredSector:
+    """The fields of a rotation sheet sector that lost sector posts use
+
+    Stored as json rather than as the sheet's own Sector, so stored days do not
+    depend on the internals of sector_accounting"""
+
+    name: str = attr.ib()
+    shortlink_gfx: str = attr.ib()
+    reward: str = attr.ib()
+    legendary_rewards: str = attr.ib()
+    surges: t.Tuple[str, ...] = attr.ib(converter=tuple)
+    threat: str = attr.ib()
+    overcharged_weapon: str = attr.ib()
+    modifiers: str = attr.ib()
+    legend_data: SectorDifficulty = attr.ib(converter=_to_sector_difficulty)
+    master_data: SectorDifficulty = attr.ib(converter=_to_sector_difficulty)
+
+    @classmethod
+    def from_sector(cls, sector: Sector) -> t.Self:
+        return cls(
+            name=sector.name,
+            shortlink_gfx=sector.shortlink_gfx,
+            reward=sector.reward,
+            legendary_rewards=sector.legendary_rewards,
+            surges=sector.surges,
+            threat=sector.threat,
+            overcharged_weapon=sector.overcharged_weapon,
+            modifiers=sector.to_sector_v1().modifiers,
+            legend_data=SectorDifficulty.from_difficulty_data(sector.legend_data),
+            master_data=SectorDifficulty.from_difficulty_data(sector.master_data),
+        )
+
+
+def encode_sector(sector: Sector) -> bytes:
+    """Encodes a sheet sector as compressed json of its `StoredSector` fields
+
+    Keys are sorted so that unchanged sectors encode to the same bytes"""
+    return zlib.compress(
+        json.dumps(
+            attr.asdict(StoredSector.from_sector(sector)),
+            sort_keys=True,
+            separators=(",", ":"),
+        ).encode(),
+        level=9,
+    )
+
+
+def decode_sector(encoded_sector: bytes) -> StoredSector:
+    return StoredSector(**json.loads(zlib.decompress(encoded_sector)))
+
+
+# Raised by the rotation sheet for days past its last row, which is how the
+# end of the season shows up when reading ahead
+END_OF_SHEET_ERRORS = (IndexError, KeyError)
+
+
+def rotation_from_sheet(
+    ls_rotation: Rotation, start_day: dt.date, days: int = ROTATION_STORE_DAYS
+) -> t.Tuple[t.Dict[dt.date, bytes], bool]:
+    """Returns the encoded sectors of the days from `start_day` on, and whether
+    the sheet was read through to its end
+
+    The sheet ends at the first day it has no sector or row for. `start_day`
+    must always be readable, so errors reading it are raised, and a sheet that
+    could not be read is never mistaken for an empty season. Unexpected errors
+    on later days are logged and stop the read early, with the read marked as
+    incomplete so that the days after it are not taken as removed"""
+    sectors = {}
+    for offset in range(days):
+        day = start_day + dt.timedelta(days=offset)
+        try:
+            sector = ls_rotation(_rotation_midpoint(day))
+        except END_OF_SHEET_ERRORS as e:
+            if day == start_day:
+                e.add_note(f"Rotation sheet has no lost sector for today, {day}\n")
+                raise
+            logger.debug(f"Rotation sheet ends before {day}: {e!r}")
+            break
+        except Exception as e:
+            e.add_note(f"Failed to read the lost sector of {day} from the sheet\n")
+            if day == start_day:
+                raise
+            logger.exception(e)
+            return sectors, False
+        if sector is None:
+            break
+        sectors[day] = encode_sector(sector)
+    return sectors, True
+
+
+class RotationStore:
+    """The season's lost sector rotation, indexed by day offset
+
+    Sectors are held encoded in a list starting at `start_day`, so looking up a
+    day is a subtraction and an index. `version` increases every time a day's
+    sector changes."""
+
+    def __init__(self):
+        self.start_day: dt.date | None = None
+        self.version = 0
+        self._encoded: t.List[bytes | None] = []
+        self._sectors: t.List[Sector | None] = []
+        self._sync_lock = aio.Lock()
+
+    def __len__(self) -> int:
+        return sum(encoded is not None for encoded in self._encoded)
+
+    def _offset(self, day: dt.date) -> int | None:
+        if self.start_day is None:
+            return None
+        offset = (day - self.start_day).days
+        return offset if 0 <= offset < len(self._encoded) else None
+
+    def _stored(self) -> t.Dict[dt.date, bytes]:
+        if self.start_day is None:
+            return {}
+        return {
+            self.start_day + dt.timedelta(days=offset): encoded
+            for offset, encoded in enumerate(self._encoded)
+            if encoded is not None
+        }
+
+    def _set(self, sectors: t.Mapping[dt.date, bytes], start_day: dt.date):
+        # Replace the stored days with `sectors` from start_day on
+        days = {day: encoded for day, encoded in sectors.items() if day >= start_day}
+
+        end_day = max(days, default=start_day)
+        self._encoded = [None] * ((end_day - start_day).days + 1)
+        self._sectors = [None] * len(self._encoded)
+        self.start_day = start_day
+        for day, encoded in days.items():
+            self._encoded[(day - start_day).days] = encoded
+
+    def sector_for(self, day: dt.date) -> StoredSector | None:
+        """Returns the sector of a rotation day, or None if it is not stored"""
+        offset = self._offset(day)
+        if offset is None or self._encoded[offset] is None:
+            return None
+        if self._sectors[offset] is None:
+            self._sectors[offset] = decode_sector(self._encoded[offset])
+        return self._sectors[offset]
+
+    def changed_days(
+        self, sectors: t.Mapping[dt.date, bytes]
+    ) -> t.Dict[dt.date, bytes]:
+        """Returns the sectors that differ from the stored ones"""
+        changed = {}
+        for day, encoded in sectors.items():
+            offset = self._offset(day)
+            if offset is None or self._encoded[offset] != encoded:
+                changed[day] = encoded
+        return changed
+
+    async def load(self):
+        """Loads the stored rotation from the database"""
+        start_day = rotation_day()
+        self._set(
+            dict(await schemas.LostSectorRotation.get_sectors(start_day)), start_day
+        )
+        self.version += 1
+
+    def removed_days(
+        self, sectors: t.Mapping[dt.date, bytes], start_day: dt.date
+    ) -> t.List[dt.date]:
+        """Returns the stored days from `start_day` on that `sectors` lacks"""
+        return [
+            day for day in self._stored() if day >= start_day and day not in sectors
+        ]
+
+    async def sync(self) -> int:
+        """Refreshes the rotation from the sheet, storing only changed days and
+        deleting past days and days no longer in the sheet
+
+        Returns the number of days that changed or were deleted"""
+        async with self._sync_lock:
+            ls_rotation = (await sheets.workbook.refresh()).ls_rotation
+            start_day = rotation_day()
+            sectors, complete = await aio.get_event_loop().run_in_executor(
+                None, rotation_from_sheet, ls_rotation, start_day
+            )
+            if not complete:
+                # Keep the stored days the sheet could not be read up to
+                sectors = {**self._stored(), **sectors}
+
+            changed = self.changed_days(sectors)
+            removed = self.removed_days(sectors, start_day)
+            if changed:
+                await schemas.LostSectorRotation.set_sectors(changed)
+            if removed:
+                await schemas.LostSectorRotation.delete_sectors(removed)
+            # Days before today are never posted again
+            await schemas.LostSectorRotation.delete_sectors_before(start_day)
+            if changed or removed:
+                self.version += 1
+            self._set(sectors, start_day)
+
+        if changed or removed:
+            logger.info(
+                f"Synced {len(changed)} changed and {len(removed)} removed"
+                + " lost sector rotation days"
+            )
+        return len(changed) + len(removed)
+
+
+store = RotationStore()
+
+
+async def current_sector(day: dt.date | None = None) -> StoredSector:
+    """Returns the sector of a rotation day, from the store where possible
+
+    Only days missing from the store are read from the sheet"""
+    day = day or rotation_day()
+    sector = store.sector_for(day)
+    if sector is None:
+        logger.warning(f"Lost sector for {day} not stored, reading it from the sheet")
+        sector = StoredSector.from_sector(
+            (await sheets.workbook.get()).ls_rotation(_rotation_midpoint(day))
+        )
+    return sector
+
+
+async def sync_rotation():
+    """Syncs the rotation store, logging rather than raising on failure"""
+    try:
+        await store.sync()
+    except Exception as e:
+        e.add_note("Failed to sync the lost sector rotation\n")
+        logger.exception(e)
+
+
+async def on_start_sync_rotation(event: lb.LightbulbStartedEvent):
+    try:
+        await store.load()
+    except Exception as e:
+        e.add_note("Failed to load the stored lost sector rotation\n")
+        logger.exception(e)
+    logger.info(f"Loaded {len(store)} lost sector rotation days")
+
+    await sync_rotation()
+
+    # Pick up sheet edits well ahead of the 1700 UTC post
+    @aiocron.crontab("30 * * * *", start=True)
+    async def hourly_rotation_sync():
+        await sync_rotation()
+
+
+def register(bot: lb.BotApp) -> None:
+    bot.listen(lb.LightbulbStartedEvent)(on_start_sync_rotation)
@@ -22,7 +22,22 @@ import miru as m
 import uvloop
 from lightbulb.ext import tasks
 
-from . import bungie_api, cfg, controller, ls, posts, source, xur
+from . import (
+    bungie_api,
+    cfg,
+    controller,
+    emojis,
+    gfx,
+    items,
+    ls,
+    ls_rotation,
+    posts,
+    source,
+    stat_alerts,
+    watches,
+    xur,
+    xur_history,
+)
 
 uvloop.install()
 bot: lb.BotApp = lb.BotApp(**cfg.lightbulb_params)
@@ -59,11 +74,18 @@ async def on_guild_rm(event: h.events.GuildLeaveEvent):
 
 if __name__ == "__main__":
     m.install(bot)
+    emojis.register(bot)
     ls.register(bot)
+    ls_rotation.register(bot)
+    gfx.register(bot)
     source.register(bot)
     controller.register(bot)
     posts.register(bot)
     bungie_api.register(bot)
     xur.register(bot)
+    xur_history.register(bot)
+    items.register(bot)
+    watches.register(bot)
+    stat_alerts.register(bot)
     tasks.load(bot)
     bot.run()
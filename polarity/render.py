@@ -0,0 +1,155 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio as aio
+import collections
+import typing as t
+
+import hikari as h
+from hmessage import HMessage
+
+# Discord's limits, see https://discord.com/developers/docs/resources/message#embed-object-embed-limits
+EMBED_DESCRIPTION_LIMIT = 4096
+MESSAGE_EMBEDS_TOTAL_LIMIT = 6000
+MESSAGE_EMBEDS_LIMIT = 10
+
+
+def _split_section(section: str, limit: int) -> t.List[str]:
+    """Splits a section into chunks of at most `limit` characters on line breaks,
+    and mid line only for lines that are longer than `limit` on their own"""
+    chunks: t.List[str] = []
+    chunk: t.List[str] = []
+    chunk_length = 0
+    for line in section.splitlines(keepends=True):
+        while len(line) > limit:
+            if chunk:
+                chunks.append("".join(chunk))
+                chunk, chunk_length = [], 0
+            chunks.append(line[:limit])
+            line = line[limit:]
+
+        if chunk_length + len(line) > limit:
+            chunks.append("".join(chunk))
+            chunk, chunk_length = [], 0
+
+        chunk.append(line)
+        chunk_length += len(line)
+
+    if chunk:
+        chunks.append("".join(chunk))
+    return chunks
+
+
+def pack_sections(
+    sections: t.Iterable[str],
+    header: str = "",
+    footer: str = "",
+    description_limit: int = EMBED_DESCRIPTION_LIMIT,
+    total_limit: int = MESSAGE_EMBEDS_TOTAL_LIMIT,
+    embeds_limit: int = MESSAGE_EMBEDS_LIMIT,
+) -> t.List[t.List[str]]:
+    """Packs rendered sections into messages of embed descriptions
+
+    Sections are appended to a description until the next one would overflow it,
+    then a new description is started, so sections are only split if they do not
+    fit in a description by themselves. Once a message is full, by length or by
+    number of embeds, the following descriptions go into another message, so
+    nothing is ever dropped. The header opens the first description and the
+    footer closes the last one."""
+    messages: t.List[t.List[t.List[str]]] = [[[header]] if header else [[]]]
+    description_length = len(header)
+    total_length = len(header)
+
+    chunks = [
+        chunk
+        for section in sections
+        for chunk in _split_section(section, description_limit)
+    ]
+    if footer:
+        chunks.append(footer)
+
+    for chunk in chunks:
+        if total_length + len(chunk) > total_limit:
+            messages.append([[]])
+            description_length = total_length = 0
+        elif description_length + len(chunk) > description_limit:
+            if len(messages[-1]) >= embeds_limit:
+                messages.append([])
+                total_length = 0
+            messages[-1].append([])
+            description_length = 0
+
+        messages[-1][-1].append(chunk)
+        description_length += len(chunk)
+        total_length += len(chunk)
+
+    return [
+        ["".join(description) for description in descriptions]
+        for descriptions in messages
+    ]
+
+
+def embeds_from_descriptions(
+    descriptions: t.Iterable[str],
+    color: h.Colorish | None = None,
+    url: str | None = None,
+) -> t.List[h.Embed]:
+    """Builds an embed per description, linking only the first
+
+    Discord merges embeds that share a url into one, hiding all but the first
+    description"""
+    return [
+        h.Embed(description=description, color=color, url=None if i else url)
+        for i, description in enumerate(descriptions)
+    ]
+
+
+class RenderCache:
+    """Keeps rendered messages keyed by a fingerprint of their inputs
+
+    A fingerprint is any hashable value that changes whenever an input to the
+    render does, such as the versions of the data it was rendered from. Renders
+    for the same fingerprint that overlap share a single render. Only the most
+    recently used `maxsize` renders are kept."""
+
+    def __init__(self, maxsize: int = 8):
+        self.maxsize = maxsize
+        self._renders: collections.OrderedDict[
+            t.Hashable, aio.Task
+        ] = collections.OrderedDict()
+
+    async def get_or_render(
+        self,
+        fingerprint: t.Hashable,
+        render: t.Callable[[], t.Awaitable[HMessage]],
+    ) -> HMessage:
+        if fingerprint in self._renders:
+            self._renders.move_to_end(fingerprint)
+        else:
+            self._renders[fingerprint] = aio.ensure_future(render())
+            while len(self._renders) > self.maxsize:
+                self._renders.popitem(last=False)
+
+        task = self._renders[fingerprint]
+        try:
+            return await aio.shield(task)
+        except Exception:
+            # Do not cache failed renders
+            if self._renders.get(fingerprint) is task:
+                del self._renders[fingerprint]
+            raise
+
+    def clear(self):
+        self._renders.clear()
@@ -19,10 +19,19 @@ import sys
 import typing as t
 
 from atlas_provider_sqlalchemy.ddl import print_ddl
-from sqlalchemy import VARCHAR, Boolean, DateTime, Integer
+from sqlalchemy import (
+    VARCHAR,
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+)
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy.sql import insert, select, update
+from sqlalchemy.sql import delete, insert, select, update
 from sqlalchemy.sql.schema import Column
 
 from polarity import cfg, utils
@@ -170,6 +179,362 @@ class BungieCredentials(Base):
             )
 
 
+class VendorSnapshot(Base):
+    """A compressed snapshot of a vendor's inventory for a week
+
+    See `polarity.vendor_history` for the snapshot encoding"""
+
+    __tablename__ = "vendor_snapshots"
+    __mapper_args__ = {"eager_defaults": True}
+
+    week = Column("week", Date, primary_key=True)
+    vendor_hash = Column("vendor_hash", BigInteger, primary_key=True)
+    snapshot = Column("snapshot", LargeBinary(16777215), nullable=False)
+    fetched_at = Column("fetched_at", DateTime, default=None)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_snapshot(
+        cls, week: dt.date, vendor_hash: int, session: AsyncSession = None
+    ) -> bytes | None:
+        return (
+            await session.execute(
+                select(cls.snapshot).where(
+                    cls.week == week, cls.vendor_hash == vendor_hash
+                )
+            )
+        ).scalar()
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def set_snapshot(
+        cls,
+        week: dt.date,
+        vendor_hash: int,
+        snapshot: bytes,
+        session: AsyncSession = None,
+    ):
+        values = {cls.snapshot: snapshot, cls.fetched_at: dt.datetime.now()}
+
+        if await cls.get_snapshot(week, vendor_hash, session=session) is None:
+            await session.execute(
+                insert(cls).values(
+                    {cls.week: week, cls.vendor_hash: vendor_hash} | values
+                )
+            )
+        else:
+            await session.execute(
+                update(cls)
+                .values(values)
+                .where(cls.week == week, cls.vendor_hash == vendor_hash)
+            )
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_snapshots(
+        cls,
+        vendor_hash: int | None = None,
+        since_week: dt.date | None = None,
+        before_week: dt.date | None = None,
+        session: AsyncSession = None,
+    ) -> t.List[t.Tuple[dt.date, int, bytes]]:
+        """Returns (week, vendor_hash, snapshot) tuples ordered by week, from
+        `since_week` on and before `before_week` if given"""
+        query = select(cls.week, cls.vendor_hash, cls.snapshot).order_by(cls.week)
+        if vendor_hash is not None:
+            query = query.where(cls.vendor_hash == vendor_hash)
+        if since_week is not None:
+            query = query.where(cls.week >= since_week)
+        if before_week is not None:
+            query = query.where(cls.week < before_week)
+        return [tuple(row) for row in (await session.execute(query)).all()]
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_weeks(cls, session: AsyncSession = None) -> t.Set[dt.date]:
+        """Returns the weeks with at least one stored snapshot"""
+        return set((await session.execute(select(cls.week).distinct())).scalars())
+
+
+class LostSectorRotation(Base):
+    """The lost sector of a rotation day, mirrored from the rotation sheet
+
+    See `polarity.ls_rotation` for the sector encoding"""
+
+    __tablename__ = "lost_sector_rotation"
+    __mapper_args__ = {"eager_defaults": True}
+
+    day = Column("day", Date, primary_key=True)
+    sector = Column("sector", LargeBinary(65535), nullable=False)
+    synced_at = Column("synced_at", DateTime, default=None)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_sectors(
+        cls, since_day: dt.date, session: AsyncSession = None
+    ) -> t.List[t.Tuple[dt.date, bytes]]:
+        """Returns (day, sector) tuples from `since_day` on, ordered by day"""
+        query = (
+            select(cls.day, cls.sector).where(cls.day >= since_day).order_by(cls.day)
+        )
+        return [tuple(row) for row in (await session.execute(query)).all()]
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def set_sectors(
+        cls, sectors: t.Mapping[dt.date, bytes], session: AsyncSession = None
+    ):
+        """Inserts or replaces the sectors of the given days"""
+        if not sectors:
+            return
+        synced_at = dt.datetime.now()
+        await session.execute(delete(cls).where(cls.day.in_(list(sectors))))
+        await session.execute(
+            insert(cls),
+            [
+                {"day": day, "sector": sector, "synced_at": synced_at}
+                for day, sector in sectors.items()
+            ],
+        )
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def delete_sectors(
+        cls, days: t.Iterable[dt.date], session: AsyncSession = None
+    ):
+        """Deletes the sectors of the given days"""
+        days = list(days)
+        if not days:
+            return
+        await session.execute(delete(cls).where(cls.day.in_(days)))
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def delete_sectors_before(cls, day: dt.date, session: AsyncSession = None):
+        """Deletes the sectors of the days before `day`"""
+        await session.execute(delete(cls).where(cls.day < day))
+
+
+class XurItemSale(Base):
+    """An item Xûr sold in a given week, indexed by item hash
+
+    Built from `VendorSnapshot`s by `polarity.xur_history`"""
+
+    __tablename__ = "xur_item_sales"
+    __mapper_args__ = {"eager_defaults": True}
+
+    id = Column("id", Integer, primary_key=True, autoincrement=True)
+    item_hash = Column("item_hash", BigInteger, nullable=False)
+    week = Column("week", Date, nullable=False, index=True)
+    location = Column("location", VARCHAR(64), default=None)
+    roll = Column("roll", VARCHAR(256), default=None)
+
+    __table_args__ = (Index("ix_xur_item_sales_item_hash_week", item_hash, week),)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def set_week_sales(
+        cls,
+        week: dt.date,
+        sales: t.Sequence[t.Tuple[int, str | None, str | None]],
+        session: AsyncSession = None,
+    ):
+        """Replaces the sales of a week with (item_hash, location, roll) tuples"""
+        await session.execute(delete(cls).where(cls.week == week))
+        if sales:
+            await session.execute(
+                insert(cls),
+                [
+                    {
+                        "item_hash": item_hash,
+                        "week": week,
+                        "location": location,
+                        "roll": roll,
+                    }
+                    for item_hash, location, roll in sales
+                ],
+            )
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_item_sales(
+        cls, item_hash: int, limit: int | None = None, session: AsyncSession = None
+    ) -> t.List[t.Tuple[dt.date, str | None, str | None]]:
+        """Returns (week, location, roll) tuples for an item, latest first"""
+        query = (
+            select(cls.week, cls.location, cls.roll)
+            .where(cls.item_hash == item_hash)
+            .order_by(cls.week.desc(), cls.id)
+            .limit(limit)
+        )
+        return [tuple(row) for row in (await session.execute(query)).all()]
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_indexed_weeks(cls, session: AsyncSession = None) -> t.Set[dt.date]:
+        return set((await session.execute(select(cls.week).distinct())).scalars())
+
+
+class ItemWatch(Base):
+    """A user's request to be notified when Xûr sells an item"""
+
+    __tablename__ = "item_watches"
+    __mapper_args__ = {"eager_defaults": True}
+
+    user_id = Column("user_id", BigInteger, primary_key=True)
+    item_hash = Column("item_hash", BigInteger, primary_key=True)
+    created_at = Column("created_at", DateTime, default=None)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def add_watch(
+        cls, user_id: int, item_hash: int, session: AsyncSession = None
+    ) -> bool:
+        """Adds a watch, returning False if the user already watches the item"""
+        existing = (
+            await session.execute(
+                select(cls.user_id).where(
+                    cls.user_id == user_id, cls.item_hash == item_hash
+                )
+            )
+        ).scalar()
+        if existing is not None:
+            return False
+
+        await session.execute(
+            insert(cls).values(
+                {
+                    cls.user_id: user_id,
+                    cls.item_hash: item_hash,
+                    cls.created_at: dt.datetime.now(),
+                }
+            )
+        )
+        return True
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def remove_watch(
+        cls, user_id: int, item_hash: int, session: AsyncSession = None
+    ) -> bool:
+        """Removes a watch, returning False if the user did not watch the item"""
+        result = await session.execute(
+            delete(cls).where(cls.user_id == user_id, cls.item_hash == item_hash)
+        )
+        return bool(result.rowcount)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_watches(
+        cls, user_id: int | None = None, session: AsyncSession = None
+    ) -> t.List[t.Tuple[int, int]]:
+        """Returns (user_id, item_hash) tuples, for one user or for everyone"""
+        query = select(cls.user_id, cls.item_hash)
+        if user_id is not None:
+            query = query.where(cls.user_id == user_id)
+        return [tuple(row) for row in (await session.execute(query)).all()]
+
+
+class XurNotification(Base):
+    """A week for which a kind of Xûr notification has been sent
+
+    Lets notifications go out at most once a week across restarts"""
+
+    __tablename__ = "xur_notifications"
+    __mapper_args__ = {"eager_defaults": True}
+
+    kind = Column("kind", VARCHAR(32), primary_key=True)
+    week = Column("week", Date, primary_key=True)
+    notified_at = Column("notified_at", DateTime, default=None)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def claim_week(
+        cls, kind: str, week: dt.date, session: AsyncSession = None
+    ) -> bool:
+        """Records a week as notified, returning False if it already was"""
+        existing = (
+            await session.execute(
+                select(cls.week).where(cls.kind == kind, cls.week == week)
+            )
+        ).scalar()
+        if existing is not None:
+            return False
+
+        await session.execute(
+            insert(cls).values(
+                {cls.kind: kind, cls.week: week, cls.notified_at: dt.datetime.now()}
+            )
+        )
+        return True
+
+
+class ArmorStatAlert(Base):
+    """A user's request to be notified when Xûr sells armor meeting stat thresholds
+
+    A class of None matches armor for any class"""
+
+    __tablename__ = "armor_stat_alerts"
+    __mapper_args__ = {"eager_defaults": True}
+
+    id = Column("id", Integer, primary_key=True, autoincrement=True)
+    user_id = Column("user_id", BigInteger, nullable=False, index=True)
+    class_name = Column("class_name", VARCHAR(16), default=None)
+    exotic_only = Column("exotic_only", Boolean, default=True)
+    min_total = Column("min_total", Integer, default=0)
+    min_mobility = Column("min_mobility", Integer, default=0)
+    min_resilience = Column("min_resilience", Integer, default=0)
+    min_recovery = Column("min_recovery", Integer, default=0)
+    min_discipline = Column("min_discipline", Integer, default=0)
+    min_intellect = Column("min_intellect", Integer, default=0)
+    min_strength = Column("min_strength", Integer, default=0)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def add_alert(
+        cls,
+        user_id: int,
+        class_name: str | None = None,
+        exotic_only: bool = True,
+        min_total: int = 0,
+        min_stats: t.Mapping[str, int] = {},
+        session: AsyncSession = None,
+    ) -> t.Self:
+        """Adds an alert, returning it
+
+        `min_stats` maps stat names, such as "Recovery", to their minimums"""
+        values = {
+            "user_id": user_id,
+            "class_name": class_name,
+            "exotic_only": exotic_only,
+            "min_total": min_total,
+        } | {
+            "min_" + stat_name.lower(): value for stat_name, value in min_stats.items()
+        }
+        result = await session.execute(insert(cls).values(values))
+        return cls(id=result.inserted_primary_key[0], **values)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def remove_alert(
+        cls, user_id: int, id: int, session: AsyncSession = None
+    ) -> bool:
+        result = await session.execute(
+            delete(cls).where(cls.user_id == user_id, cls.id == id)
+        )
+        return bool(result.rowcount)
+
+    @classmethod
+    @utils.ensure_session(db_session)
+    async def get_alerts(
+        cls, user_id: int | None = None, session: AsyncSession = None
+    ) -> t.List[t.Self]:
+        query = select(cls).order_by(cls.id)
+        if user_id is not None:
+            query = query.where(cls.user_id == user_id)
+        return list((await session.execute(query)).scalars().all())
+
+
 async def recreate_all():
     # db_engine = create_engine(cfg.db_url, connect_args=cfg.db_connect_args)
     db_engine = create_async_engine(cfg.db_url_async, connect_args=cfg.db_connect_args)
@@ -0,0 +1,156 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio as aio
+import functools
+import logging
+import time
+import typing as t
+
+import attr
+import gspread
+from sector_accounting import xur as xur_support_data
+from sector_accounting.sector_accounting import Rotation
+
+from . import cfg
+
+logger = logging.getLogger(__name__)
+
+
+@attr.s(frozen=True)
+class SheetSnapshot:
+    """Data parsed from the lost sector and Xûr workbook at one point in time
+
+    `version` increases by one with every refresh, so it can be used to tell
+    whether anything derived from a snapshot is out of date"""
+
+    version: int = attr.ib()
+    fetched_at: float = attr.ib()
+    xur_locations: xur_support_data.XurLocations = attr.ib()
+    xur_armor_sets: xur_support_data.XurArmorSets = attr.ib()
+    ls_rotation: Rotation = attr.ib()
+
+
+class WorkbookCache:
+    """Caches a snapshot of the workbook shared by all sheet backed posts
+
+    Snapshots younger than `ttl` seconds are served as is. Older snapshots are
+    still served while a single background refresh replaces them, so only the
+    very first request waits on Google Sheets. A refresh only checks when the
+    workbook was last modified, and parses it again only if it changed."""
+
+    def __init__(self, url: str, credentials: dict, ttl: float):
+        self.url = url
+        self.credentials = credentials
+        self.ttl = ttl
+        self._snapshot: SheetSnapshot | None = None
+        self._refresh_task: aio.Task | None = None
+        self._spreadsheet: gspread.Spreadsheet | None = None
+        self._modified_time: str | None = None
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version if self._snapshot else 0
+
+    def _fetch_modified_time(self) -> str | None:
+        try:
+            if self._spreadsheet is None:
+                self._spreadsheet = gspread.service_account_from_dict(
+                    self.credentials
+                ).open_by_url(self.url)
+            return self._spreadsheet.get_lastUpdateTime()
+        except Exception as e:
+            # Parse the workbook regardless, it may have changed
+            e.add_note("Failed to check when the workbook was last modified\n")
+            logger.exception(e)
+            return None
+
+    async def _fetch(self, version: int) -> SheetSnapshot:
+        # The sheets client is blocking, keep it off the event loop
+        loop = aio.get_event_loop()
+        xur_locations, xur_armor_sets, ls_rotation = await aio.gather(
+            loop.run_in_executor(
+                None,
+                xur_support_data.XurLocations.from_gspread_url,
+                self.url,
+                self.credentials,
+            ),
+            loop.run_in_executor(
+                None,
+                xur_support_data.XurArmorSets.from_gspread_url,
+                self.url,
+                self.credentials,
+            ),
+            loop.run_in_executor(
+                None,
+                functools.partial(
+                    Rotation.from_gspread_url, self.url, self.credentials, buffer=5
+                ),
+            ),
+        )
+        return SheetSnapshot(
+            version=version,
+            fetched_at=time.monotonic(),
+            xur_locations=xur_locations,
+            xur_armor_sets=xur_armor_sets,
+            ls_rotation=ls_rotation,
+        )
+
+    async def _refresh(self) -> SheetSnapshot:
+        try:
+            modified_time = await aio.get_event_loop().run_in_executor(
+                None, self._fetch_modified_time
+            )
+            if (
+                self._snapshot is not None
+                and modified_time is not None
+                and modified_time == self._modified_time
+            ):
+                # Unchanged, keep the version so derived data stays valid
+                self._snapshot = attr.evolve(
+                    self._snapshot, fetched_at=time.monotonic()
+                )
+            else:
+                self._snapshot = await self._fetch(self.version + 1)
+                self._modified_time = modified_time
+            return self._snapshot
+        finally:
+            self._refresh_task = None
+
+    def refresh(self) -> t.Awaitable[SheetSnapshot]:
+        """Refreshes the snapshot, joining any refresh already in progress"""
+        if self._refresh_task is None:
+            self._refresh_task = aio.create_task(self._refresh())
+        return self._refresh_task
+
+    def _log_failed_refresh(self, task: aio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error("Failed to refresh the workbook", exc_info=task.exception())
+
+    async def get(self) -> SheetSnapshot:
+        """Returns the current snapshot, fetching it if there is none yet"""
+        if self._snapshot is None:
+            return await self.refresh()
+
+        if (
+            time.monotonic() - self._snapshot.fetched_at > self.ttl
+            and self._refresh_task is None
+        ):
+            self.refresh().add_done_callback(self._log_failed_refresh)
+
+        return self._snapshot
+
+
+workbook = WorkbookCache(cfg.sheets_ls_url, cfg.gsheets_credentials, cfg.sheets_ttl)
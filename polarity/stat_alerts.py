@@ -0,0 +1,268 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import datetime as dt
+import logging
+import typing as t
+
+import lightbulb as lb
+import numpy as np
+
+from . import bungie_api as api
+from . import schemas, vendor_history
+
+logger = logging.getLogger(__name__)
+
+MAX_ALERTS_PER_USER = 10
+ALERT_NOTIFICATION_KIND = "armor_stat_alerts"
+# Class code of alerts that match armor for any class
+ANY_CLASS = -1
+
+
+def _class_code(class_name: str | None) -> int:
+    try:
+        return api.DESTINY_CLASSES_ENUM.index(class_name)
+    except ValueError:
+        return ANY_CLASS
+
+
+class StatAlertMatrix:
+    """Armor stat alerts held as one threshold matrix
+
+    Each row holds an alert's minimum for every stat in the order of
+    `DestinyArmor._tracked_stats`, followed by its minimum total, so all alerts
+    are checked against all armor in a single broadcast comparison"""
+
+    def __init__(self, alerts: t.Sequence[schemas.ArmorStatAlert]):
+        self.alert_ids = np.array([alert.id for alert in alerts], dtype=np.int64)
+        self.user_ids = np.array([alert.user_id for alert in alerts], dtype=np.int64)
+        self.class_codes = np.array(
+            [_class_code(alert.class_name) for alert in alerts], dtype=np.int8
+        )
+        self.exotic_only = np.array(
+            [bool(alert.exotic_only) for alert in alerts], dtype=bool
+        )
+        self.thresholds = np.array(
+            [
+                [
+                    getattr(alert, "min_" + stat_name.lower()) or 0
+                    for stat_name in api.DestinyArmor._tracked_stats
+                ]
+                + [alert.min_total or 0]
+                for alert in alerts
+            ],
+            dtype=np.int32,
+        ).reshape(len(alerts), len(api.DestinyArmor._tracked_stats) + 1)
+
+    def __len__(self) -> int:
+        return len(self.alert_ids)
+
+    def add(self, alert: schemas.ArmorStatAlert):
+        """Appends the row of a new alert"""
+        rows = StatAlertMatrix([alert])
+        self.alert_ids = np.concatenate([self.alert_ids, rows.alert_ids])
+        self.user_ids = np.concatenate([self.user_ids, rows.user_ids])
+        self.class_codes = np.concatenate([self.class_codes, rows.class_codes])
+        self.exotic_only = np.concatenate([self.exotic_only, rows.exotic_only])
+        self.thresholds = np.concatenate([self.thresholds, rows.thresholds])
+
+    def remove(self, alert_id: int):
+        """Drops the row of an alert, if present"""
+        keep = self.alert_ids != alert_id
+        self.alert_ids = self.alert_ids[keep]
+        self.user_ids = self.user_ids[keep]
+        self.class_codes = self.class_codes[keep]
+        self.exotic_only = self.exotic_only[keep]
+        self.thresholds = self.thresholds[keep]
+
+    def match(
+        self, armor_pieces: t.Sequence[api.DestinyArmor]
+    ) -> t.Dict[int, t.List[api.DestinyArmor]]:
+        """Returns the armor pieces matching any of each user's alerts"""
+        if not len(self) or not armor_pieces:
+            return {}
+
+        stat_values = np.array(
+            [
+                np.append(armor_piece.stat_values, armor_piece.stat_total)
+                for armor_piece in armor_pieces
+            ],
+            dtype=np.int32,
+        )
+        class_codes = np.array(
+            [_class_code(armor_piece.class_) for armor_piece in armor_pieces],
+            dtype=np.int8,
+        )
+        is_exotic = np.array([armor_piece.is_exotic for armor_piece in armor_pieces])
+
+        # alerts x armor pieces
+        matches = (
+            (self.thresholds[:, None, :] <= stat_values[None, :, :]).all(axis=2)
+            & (
+                (self.class_codes[:, None] == ANY_CLASS)
+                | (self.class_codes[:, None] == class_codes[None, :])
+            )
+            & (~self.exotic_only[:, None] | is_exotic[None, :])
+        )
+
+        matched_pieces: t.Dict[int, t.Set[int]] = {}
+        for alert_row, piece_row in zip(*np.nonzero(matches)):
+            matched_pieces.setdefault(int(self.user_ids[alert_row]), set()).add(
+                int(piece_row)
+            )
+
+        return {
+            user_id: [armor_pieces[row] for row in sorted(rows)]
+            for user_id, rows in matched_pieces.items()
+        }
+
+
+async def reload_alerts(bot: lb.BotApp) -> None:
+    """Rebuilds the alert matrix from the database"""
+    bot.d.armor_stat_alerts = StatAlertMatrix(await schemas.ArmorStatAlert.get_alerts())
+
+
+def alert_description(alert: schemas.ArmorStatAlert) -> str:
+    conditions = [
+        f"{stat_name} ≥ {getattr(alert, 'min_' + stat_name.lower())}"
+        for stat_name in api.DestinyArmor._tracked_stats
+        if getattr(alert, "min_" + stat_name.lower())
+    ]
+    if alert.min_total:
+        conditions.insert(0, f"Total ≥ {alert.min_total}")
+    return (
+        f"`#{alert.id}` Any {alert.class_name or 'class'} "
+        + ("exotic" if alert.exotic_only else "armor")
+        + (": " + ", ".join(conditions) if conditions else "")
+    )
+
+
+def alert_notification(armor_pieces: t.List[api.DestinyArmor]) -> str:
+    return "Xûr is selling armor that meets your stat alerts this week!\n" + "\n".join(
+        f"- [{armor_piece.name}]({armor_piece.lightgg_url}) "
+        + f"({armor_piece.class_} {armor_piece.bucket}): "
+        + " / ".join(
+            f"{value} {stat_name[:3]}"
+            for stat_name, value in zip(
+                api.DestinyArmor._tracked_stats, armor_piece.stat_values
+            )
+        )
+        + f", Σ {armor_piece.stat_total}"
+        for armor_piece in armor_pieces
+    )
+
+
+async def notify_alerts(bot: lb.BotApp, week: dt.date | None = None) -> int:
+    """Queues DMs to every user with an alert met by armor Xûr sells this week
+
+    Users are notified at most once a week, even across restarts. Returns the
+    number of users queued"""
+    week = week or vendor_history.xur_week()
+    vendor = await vendor_history.load_vendor(await api.get_manifest_table(), week)
+    if vendor is None:
+        logger.warning(f"No stored Xur inventory for {week}, not checking alerts")
+        return 0
+
+    if not await schemas.XurNotification.claim_week(ALERT_NOTIFICATION_KIND, week):
+        return 0
+    matches = bot.d.armor_stat_alerts.match(
+        [item for item in vendor.sale_items if isinstance(item, api.DestinyArmor)]
+    )
+    for user_id, armor_pieces in matches.items():
+        bot.d.dm_dispatcher.submit(user_id, alert_notification(armor_pieces))
+
+    logger.info(f"Queued Xur stat alert notifications for {len(matches)} users")
+    return len(matches)
+
+
+@lb.command("alert", "Get a DM when Xûr sells armor with the stats you want")
+@lb.implements(lb.SlashCommandGroup)
+async def alert_group(ctx: lb.Context):
+    pass
+
+
+@alert_group.child
+@lb.option("strength", "Minimum Strength", int, min_value=0, default=0)
+@lb.option("intellect", "Minimum Intellect", int, min_value=0, default=0)
+@lb.option("discipline", "Minimum Discipline", int, min_value=0, default=0)
+@lb.option("recovery", "Minimum Recovery", int, min_value=0, default=0)
+@lb.option("resilience", "Minimum Resilience", int, min_value=0, default=0)
+@lb.option("mobility", "Minimum Mobility", int, min_value=0, default=0)
+@lb.option("total", "Minimum stat total", int, min_value=0, default=0)
+@lb.option("exotic_only", "Only alert for exotic armor", bool, default=True)
+@lb.option(
+    "class",
+    "Class of the armor",
+    str,
+    choices=["Any", *api.DESTINY_CLASSES_ENUM],
+    default="Any",
+)
+@lb.command("add", "Add an armor stat alert", ephemeral=True, pass_options=True)
+@lb.implements(lb.SlashSubCommand)
+async def alert_add(ctx: lb.Context, **options):
+    if len(await schemas.ArmorStatAlert.get_alerts(ctx.author.id)) >= (
+        MAX_ALERTS_PER_USER
+    ):
+        return await ctx.respond(
+            f"You can have at most {MAX_ALERTS_PER_USER} alerts, "
+            + "remove one to add another"
+        )
+
+    class_name = options["class"]
+    alert = await schemas.ArmorStatAlert.add_alert(
+        ctx.author.id,
+        class_name=None if class_name == "Any" else class_name,
+        exotic_only=options["exotic_only"],
+        min_total=options["total"],
+        min_stats={
+            stat_name: options[stat_name.lower()]
+            for stat_name in api.DestinyArmor._tracked_stats
+        },
+    )
+    ctx.app.d.armor_stat_alerts.add(alert)
+    await ctx.respond(f"Added alert {alert_description(alert)}")
+
+
+@alert_group.child
+@lb.option("id", "Id of the alert, as shown by /alert list", int, required=True)
+@lb.command("remove", "Remove an armor stat alert", ephemeral=True, pass_options=True)
+@lb.implements(lb.SlashSubCommand)
+async def alert_remove(ctx: lb.Context, id: int):
+    if not await schemas.ArmorStatAlert.remove_alert(ctx.author.id, id):
+        return await ctx.respond(f"You have no alert #{id}")
+    ctx.app.d.armor_stat_alerts.remove(id)
+    await ctx.respond(f"Removed alert #{id}")
+
+
+@alert_group.child
+@lb.command("list", "List your armor stat alerts", ephemeral=True)
+@lb.implements(lb.SlashSubCommand)
+async def alert_list(ctx: lb.Context):
+    alerts = await schemas.ArmorStatAlert.get_alerts(ctx.author.id)
+    if not alerts:
+        return await ctx.respond("You have no armor stat alerts")
+    await ctx.respond("\n".join(alert_description(alert) for alert in alerts))
+
+
+async def on_start_load_alerts(event: lb.LightbulbStartedEvent):
+    await reload_alerts(event.app)
+    logger.info(f"Loaded {len(event.app.d.armor_stat_alerts)} armor stat alerts")
+
+
+def register(bot: lb.BotApp) -> None:
+    bot.d.armor_stat_alerts = StatAlertMatrix([])
+
+    bot.command(alert_group)
+    bot.listen(lb.LightbulbStartedEvent)(on_start_load_alerts)
@@ -14,12 +14,15 @@
 # mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
 
 import asyncio as aio
+import collections
 import concurrent.futures
 import contextlib
 import datetime as dt
 import functools
+import hashlib
 import logging
 import typing as t
+from pathlib import Path
 
 import aiofiles
 import aiohttp
@@ -82,14 +85,54 @@ def day_period(today: dt.datetime = None) -> t.Tuple[dt.datetime, dt.datetime]:
     return today, today_end
 
 
-async def follow_link_single_step(
-    url: str, logger=logging.getLogger("main/" + __name__)
-) -> str:
-    async with aiohttp.ClientSession() as session:
-        retries = 10
-        retry_delay = 10
-        for i in range(retries):
-            async with session.get(url, allow_redirects=False) as resp:
+class RedirectCache:
+    """Caches where links redirect to, for `ttl` seconds
+
+    Links that fail with an error status are cached as None for `negative_ttl`
+    seconds so a broken link does not hold up every post that uses it. Network
+    errors and timeouts are not cached, as the next lookup may well succeed.
+    Concurrent lookups of the same link share one request, and all requests
+    share one session."""
+
+    def __init__(
+        self,
+        ttl: float = 7200,
+        negative_ttl: float = 300,
+        retries: int = 3,
+        retry_delay: float = 2,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.retries = retries
+        self.retry_delay = retry_delay
+        # url -> (expiry as per the event loop clock, location or None)
+        self._entries: t.Dict[str, t.Tuple[float, str | None]] = {}
+        self._pending: t.Dict[str, aio.Task] = {}
+        self._session: aiohttp.ClientSession | None = None
+
+    def _client_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def get(self, url: str) -> t.Tuple[bool, str | None]:
+        """Returns whether a link is cached and where it redirects to if so"""
+        try:
+            expiry, location = self._entries[url]
+        except KeyError:
+            return False, None
+        if expiry < aio.get_event_loop().time():
+            del self._entries[url]
+            return False, None
+        return True, location
+
+    async def _fetch(self, url: str, logger: logging.Logger) -> str | None:
+        for i in range(self.retries):
+            async with self._client_session().get(url, allow_redirects=False) as resp:
                 try:
                     return resp.headers["Location"]
                 except KeyError:
@@ -100,13 +143,57 @@ async def follow_link_single_step(
                             "Could not find redirect for url "
                             + "{}, (status {})".format(url, resp.status)
                         )
-                        if i < retries - 1:
+                        if i < self.retries - 1:
                             logger.error("Retrying...")
-                        await aio.sleep(retry_delay)
+                            await aio.sleep(self.retry_delay)
                         continue
                     else:
                         return url
 
+    async def _resolve(self, url: str, logger: logging.Logger) -> str | None:
+        try:
+            location = await self._fetch(url, logger)
+        except aiohttp.InvalidURL:
+            # A malformed link, not a failure worth caching
+            raise
+        except (aiohttp.ClientError, aio.TimeoutError) as e:
+            logger.error(f"Could not resolve redirect for url {url}: {e!r}")
+            return None
+        finally:
+            self._pending.pop(url, None)
+
+        ttl = self.ttl if location is not None else self.negative_ttl
+        self._entries[url] = (aio.get_event_loop().time() + ttl, location)
+        return location
+
+    async def resolve(
+        self,
+        url: str,
+        refresh: bool = False,
+        logger: logging.Logger = logging.getLogger("main/" + __name__),
+    ) -> str | None:
+        """Returns where a link redirects to, the link itself if it does not
+        redirect, or None if it could not be resolved
+
+        Raises aiohttp.InvalidURL for invalid links"""
+        if not refresh:
+            cached, location = self.get(url)
+            if cached:
+                return location
+
+        if url not in self._pending:
+            self._pending[url] = aio.create_task(self._resolve(url, logger))
+        return await aio.shield(self._pending[url])
+
+
+redirect_cache = RedirectCache()
+
+
+async def follow_link_single_step(
+    url: str, logger=logging.getLogger("main/" + __name__)
+) -> str | None:
+    return await redirect_cache.resolve(url, logger=logger)
+
 
 @attr.s
 class MessageFailureError(Exception):
@@ -221,29 +308,169 @@ async def send_message(
     return msg
 
 
+def content_addressed_attachment(content: bytes, name: str) -> h.Bytes:
+    """Returns `content` as an attachment named by the hash of its content
+
+    Message digests compare attachments by file name, since posted attachments
+    are only known by their CDN url. Attachments named this way are only seen
+    as unchanged if their content is"""
+    return h.Bytes(content, hashlib.sha256(content).hexdigest() + Path(name).suffix)
+
+
+def _attachment_digest_part(attachment: h.Resourceish) -> str:
+    # Attachments are referred to by name when sent, and by their CDN url once
+    # posted, so only their names can be compared. Attachments whose content
+    # may change under the same name must be content addressed, see
+    # content_addressed_attachment
+    return "attachment://" + h.files.ensure_resource(attachment).filename
+
+
+def _embed_digest_parts(embed: h.Embed) -> tuple:
+    def resource_url(resource) -> str | None:
+        if not resource:
+            return None
+        url = str(resource.url)
+        if url.startswith("attachment://") or "/attachments/" in url:
+            return _attachment_digest_part(resource)
+        return url
+
+    return (
+        embed.title,
+        embed.description,
+        embed.url,
+        int(embed.color) if embed.color is not None else None,
+        embed.timestamp,
+        (embed.footer.text, resource_url(embed.footer.icon)) if embed.footer else None,
+        resource_url(embed.image),
+        resource_url(embed.thumbnail),
+        (
+            (embed.author.name, embed.author.url, resource_url(embed.author.icon))
+            if embed.author
+            else None
+        ),
+        tuple((field.name, field.value, field.is_inline) for field in embed.fields),
+    )
+
+
+def message_digest(message: HMessage) -> str:
+    """Returns a digest of what a message displays, to tell if it has changed"""
+    message_kwargs = message.to_message_kwargs()
+    parts = (
+        message_kwargs.get("content") or None,
+        tuple(
+            _embed_digest_parts(embed) for embed in message_kwargs.get("embeds") or ()
+        ),
+        tuple(
+            _attachment_digest_part(attachment)
+            for attachment in message_kwargs.get("attachments") or ()
+        ),
+    )
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+class MessageEditor:
+    """Edits messages only when their content changes, coalescing rapid edits
+
+    The digest of the last content sent to each message is remembered. Edits to
+    the same content are skipped, and edits that arrive within `debounce`
+    seconds of each other are coalesced so only the latest content is sent."""
+
+    def __init__(self, debounce: float = 1.0, maxsize: int = 256):
+        self.debounce = debounce
+        self.maxsize = maxsize
+        self._digests: collections.OrderedDict[int, str] = collections.OrderedDict()
+        self._pending: t.Dict[int, t.Tuple[HMessage, aio.Future]] = {}
+
+    def remember(self, message_id: int, message: HMessage):
+        """Records the content a message was sent with"""
+        self._digests[message_id] = message_digest(message)
+        self._digests.move_to_end(message_id)
+        while len(self._digests) > self.maxsize:
+            self._digests.popitem(last=False)
+
+    def _last_digest(self, message: h.Message) -> str:
+        if message.id not in self._digests:
+            self.remember(message.id, HMessage.from_message(message))
+        return self._digests[message.id]
+
+    async def edit(self, message: h.Message, hmessage: HMessage) -> bool:
+        """Edits the message to show `hmessage` unless it already does
+
+        Returns True if the message was edited"""
+        if message.id in self._pending:
+            # Another edit is waiting out the debounce, send this content instead
+            _, edited = self._pending[message.id]
+            self._pending[message.id] = (hmessage, edited)
+            return await aio.shield(edited)
+
+        if message_digest(hmessage) == self._last_digest(message):
+            return False
+
+        edited = aio.get_event_loop().create_future()
+        self._pending[message.id] = (hmessage, edited)
+        try:
+            await aio.sleep(self.debounce)
+            hmessage, _ = self._pending.pop(message.id)
+            if message_digest(hmessage) == self._last_digest(message):
+                edited.set_result(False)
+            else:
+                await message.edit(**hmessage.to_message_kwargs())
+                self.remember(message.id, hmessage)
+                edited.set_result(True)
+        except BaseException as e:
+            self._pending.pop(message.id, None)
+            if not edited.done():
+                if isinstance(e, aio.CancelledError):
+                    edited.cancel()
+                else:
+                    edited.set_exception(e)
+                    # Coalesced edits see the exception, do not warn when there
+                    # are none
+                    edited.exception()
+            raise
+
+        return edited.result()
+
+
+message_editor = MessageEditor()
+
+
+async def fetch_linked_image(
+    url: str, session: aiohttp.ClientSession | None = None, attempts: int = 5
+) -> t.Tuple[str, bytes] | None:
+    """Returns the name and content of a linked image
+
+    Returns None if the image could not be fetched in `attempts` tries. Throws
+    an aiohttp.client_exceptions.InvalidURL on an invalid url"""
+    async with contextlib.AsyncExitStack() as stack:
+        if session is None:
+            session = await stack.enter_async_context(aiohttp.ClientSession())
+        backoff_timer = 1
+        for _ in range(attempts):
+            async with session.get(url) as resp:
+                if resp.status == 200:
+                    return _get_uri_name(resp.url), await resp.read()
+            await aio.sleep(backoff_timer)
+            backoff_timer = backoff_timer + (1 / backoff_timer)
+    return None
+
+
 async def download_linked_image(url: str) -> t.Union[str, None]:
     # Returns the name of the downloaded image
-    # Throws an aiohttp.client_exceptions.InvalidURL on
-    # an invalid url
     # ToDo: Implement a per URL lock on this function
     #       Also implement a naming scheme based on path
     #       And implement a name size limit as required
-    async with aiohttp.ClientSession() as session:
-        backoff_timer = 1
-        try:
-            while True:
-                async with session.get(url) as resp:
-                    if resp.status == 200:
-                        name = _get_uri_name(resp.url)
-                        f = await aiofiles.open(name, mode="wb")
-                        await f.write(await resp.read())
-                        await f.close()
-                        return name
-                    else:
-                        await aio.sleep(backoff_timer)
-                        backoff_timer = backoff_timer + (1 / backoff_timer)
-        except aiohttp.InvalidURL:
-            return None
+    try:
+        image = await fetch_linked_image(url)
+    except aiohttp.InvalidURL:
+        return None
+    if image is None:
+        return None
+
+    name, content = image
+    async with aiofiles.open(name, mode="wb") as f:
+        await f.write(content)
+    return name
 
 
 def _get_uri_name(url: str) -> str:
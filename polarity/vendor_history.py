@@ -0,0 +1,201 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import datetime as dt
+import json
+import typing as t
+import zlib
+
+from . import bungie_api as api
+from . import schemas
+
+XUR_VENDOR_HASHES = (api.XUR_VENDOR_HASH, api.XUR_STRANGE_GEAR_VENDOR_HASH)
+
+
+def xur_week(now: dt.datetime | None = None) -> dt.date:
+    """Returns the date of the Friday on which the current or last Xûr visit began
+
+    Xûr arrives at 1700 UTC on Fridays, so earlier times on a Friday belong to
+    the previous week's visit"""
+    if now is None:
+        now = dt.datetime.now(tz=dt.timezone.utc)
+
+    arrival = now - dt.timedelta(days=(now.weekday() - 4) % 7)
+    arrival = arrival.replace(hour=17, minute=0, second=0, microsecond=0)
+    if arrival > now:
+        arrival -= dt.timedelta(days=7)
+
+    return arrival.date()
+
+
+def xur_arrival(week: dt.date) -> dt.datetime:
+    """Returns the time at which Xûr arrives for the visit starting in `week`"""
+    return dt.datetime.combine(week, dt.time(17), tzinfo=dt.timezone.utc)
+
+
+def xur_departure(week: dt.date) -> dt.datetime:
+    """Returns the time at which Xûr leaves at the weekly reset after `week`'s visit"""
+    return xur_arrival(week) + dt.timedelta(days=4)
+
+
+def _prune_vendor_response(response: dict) -> dict:
+    # Keep only what DestinyVendor.from_vendors_api_response reads, in the same
+    # shape, so that a decoded snapshot parses exactly like a live response
+    vendor: dict = response["vendor"]["data"]
+    item_components: dict = response["itemComponents"]
+
+    def component_data(name: str) -> dict:
+        return item_components.get(name, {}).get("data", {})
+
+    return {
+        "vendor": {
+            "data": {
+                "vendorHash": vendor["vendorHash"],
+                "vendorLocationIndex": vendor["vendorLocationIndex"],
+            }
+        },
+        "sales": {
+            "data": {
+                key: {
+                    "itemHash": sale_item["itemHash"],
+                    "costs": [
+                        {
+                            "itemHash": cost.get("itemHash", 0),
+                            "quantity": cost.get("quantity", 0),
+                        }
+                        for cost in sale_item.get("costs", [])
+                    ],
+                }
+                for key, sale_item in response["sales"]["data"].items()
+            }
+        },
+        "itemComponents": {
+            "stats": {
+                "data": {
+                    key: {
+                        "stats": {
+                            stat_key: {
+                                "statHash": stat["statHash"],
+                                "value": stat["value"],
+                            }
+                            for stat_key, stat in stats.get("stats", {}).items()
+                        }
+                    }
+                    for key, stats in component_data("stats").items()
+                }
+            },
+            "perks": {
+                "data": {
+                    key: {
+                        "perks": [
+                            {"perkHash": perk["perkHash"]}
+                            for perk in perks.get("perks", [])
+                        ]
+                    }
+                    for key, perks in component_data("perks").items()
+                }
+            },
+            "reusablePlugs": {
+                "data": {
+                    key: {
+                        "plugs": {
+                            socket_index: [
+                                {"plugItemHash": plug["plugItemHash"]}
+                                for plug in socket_plugs
+                            ]
+                            for socket_index, socket_plugs in plugs.get(
+                                "plugs", {}
+                            ).items()
+                        }
+                    }
+                    for key, plugs in component_data("reusablePlugs").items()
+                }
+            },
+        },
+    }
+
+
+def encode_vendor_response(response: dict) -> bytes:
+    """Encodes a vendor API response as a compact, compressed snapshot"""
+    return zlib.compress(
+        json.dumps(_prune_vendor_response(response), separators=(",", ":")).encode(),
+        level=9,
+    )
+
+
+def decode_vendor_response(snapshot: bytes) -> dict:
+    """Decodes a snapshot into a vendor API response"""
+    return json.loads(zlib.decompress(snapshot))
+
+
+def parse_vendor_responses(
+    responses: t.Iterable[dict], manifest_table: dict
+) -> api.DestinyVendor:
+    """Parses and combines vendor responses into a single DestinyVendor"""
+    vendor = None
+    for response in responses:
+        vendor_ = api.DestinyVendor.from_vendors_api_response(
+            response, manifest_table=manifest_table
+        )
+        vendor = vendor_ if vendor is None else vendor + vendor_
+    return vendor
+
+
+async def store_vendor_response(response: dict, week: dt.date | None = None):
+    await schemas.VendorSnapshot.set_snapshot(
+        week=week or xur_week(),
+        vendor_hash=response["vendor"]["data"]["vendorHash"],
+        snapshot=encode_vendor_response(response),
+    )
+
+
+async def load_vendor_snapshots(
+    week: dt.date | None = None,
+    vendor_hashes: t.Sequence[int] = XUR_VENDOR_HASHES,
+) -> t.List[bytes] | None:
+    """Loads the stored snapshots of each vendor for a week, in order
+
+    Returns None unless a snapshot is stored for every vendor hash"""
+    snapshots = []
+    for vendor_hash in vendor_hashes:
+        snapshot = await schemas.VendorSnapshot.get_snapshot(
+            week=week or xur_week(), vendor_hash=vendor_hash
+        )
+        if snapshot is None:
+            return None
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def vendor_from_snapshots(
+    snapshots: t.Iterable[bytes], manifest_table: dict
+) -> api.DestinyVendor:
+    return parse_vendor_responses(
+        (decode_vendor_response(snapshot) for snapshot in snapshots), manifest_table
+    )
+
+
+async def load_vendor(
+    manifest_table: dict,
+    week: dt.date | None = None,
+    vendor_hashes: t.Sequence[int] = XUR_VENDOR_HASHES,
+) -> api.DestinyVendor | None:
+    """Loads the stored vendors for a week as a single DestinyVendor
+
+    Returns None unless a snapshot is stored for every vendor hash"""
+    snapshots = await load_vendor_snapshots(week, vendor_hashes)
+    if snapshots is None:
+        return None
+    return vendor_from_snapshots(snapshots, manifest_table)
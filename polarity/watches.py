@@ -0,0 +1,261 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio as aio
+import datetime as dt
+import logging
+import typing as t
+
+import hikari as h
+import lightbulb as lb
+
+from . import bungie_api as api
+from . import items, schemas, vendor_history
+
+logger = logging.getLogger(__name__)
+
+# DMs sent per second by the dispatcher, well within Discord's global rate limit
+DM_RATE = 5
+MAX_WATCHES_PER_USER = 25
+WATCH_NOTIFICATION_KIND = "item_watches"
+
+
+def watch_keys(item_hash: int, manifest_table: dict) -> t.List[t.Tuple[str, t.Any]]:
+    """Returns the keys an item matches watches on
+
+    Other versions of an item share its collectible and reissues share its name,
+    so watches match on those as well as on the exact hash"""
+    keys = [("hash", item_hash)]
+    entry = manifest_table["DestinyInventoryItemDefinition"].get(item_hash)
+    if entry is None:
+        return keys
+    if entry.get("collectibleHash"):
+        keys.append(("collectible", entry["collectibleHash"]))
+    name = entry.get("displayProperties", {}).get("name")
+    if name:
+        keys.append(("name", items.normalize_name(name)))
+    return keys
+
+
+class WatchIndex:
+    """Inverted index of item watches, from item hash to the users watching it
+
+    Items on sale match watches by `watch_keys`"""
+
+    def __init__(self, watches: t.Iterable[t.Tuple[int, int]] = ()):
+        self._watchers: t.Dict[int, t.Set[int]] = {}
+        for user_id, item_hash in watches:
+            self.add(user_id, item_hash)
+
+    def __len__(self) -> int:
+        return sum(len(watchers) for watchers in self._watchers.values())
+
+    def add(self, user_id: int, item_hash: int):
+        self._watchers.setdefault(item_hash, set()).add(user_id)
+
+    def remove(self, user_id: int, item_hash: int):
+        watchers = self._watchers.get(item_hash)
+        if watchers is not None:
+            watchers.discard(user_id)
+            if not watchers:
+                del self._watchers[item_hash]
+
+    def match(
+        self, sale_items: t.Iterable[api.DestinyItem], manifest_table: dict
+    ) -> t.Dict[int, t.List[api.DestinyItem]]:
+        """Returns the watched items on sale for each user watching any, in a
+        single pass over the items on sale"""
+        watchers_by_key: t.Dict[t.Tuple[str, t.Any], t.Set[int]] = {}
+        for item_hash, watchers in self._watchers.items():
+            for key in watch_keys(item_hash, manifest_table):
+                watchers_by_key.setdefault(key, set()).update(watchers)
+
+        matches: t.Dict[int, t.List[api.DestinyItem]] = {}
+        for item in sale_items:
+            user_ids = set()
+            for key in watch_keys(item.hash, manifest_table):
+                user_ids |= watchers_by_key.get(key, set())
+            for user_id in user_ids:
+                matches.setdefault(user_id, []).append(item)
+        return matches
+
+
+class DMDispatcher:
+    """Sends direct messages from a queue, at most `rate` per second
+
+    Runs in the background so that bulk notifications never hold up posts"""
+
+    def __init__(self, bot: lb.BotApp, rate: float = DM_RATE):
+        self.bot = bot
+        self.rate = rate
+        self._queue: aio.Queue[t.Tuple[int, str]] = aio.Queue()
+        self._task: aio.Task | None = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = aio.create_task(self._run())
+
+    def submit(self, user_id: int, content: str):
+        self._queue.put_nowait((user_id, content))
+
+    async def _run(self):
+        while True:
+            user_id, content = await self._queue.get()
+            try:
+                channel = await self.bot.rest.create_dm_channel(user_id)
+                await channel.send(content)
+            except (h.ForbiddenError, h.NotFoundError):
+                # The user has DMs closed or has left, nothing to be done
+                logger.info(f"Could not DM user {user_id}")
+            except Exception as e:
+                e.add_note(f"Failed to DM user {user_id}\n")
+                logger.exception(e)
+            finally:
+                self._queue.task_done()
+            await aio.sleep(1 / self.rate)
+
+
+def watch_notification(items_on_sale: t.List[api.DestinyItem]) -> str:
+    return "Xûr is selling an item you are watching this week!\n" + "\n".join(
+        f"- [{item.name}]({item.lightgg_url})" for item in items_on_sale
+    )
+
+
+async def notify_watchers(bot: lb.BotApp, week: dt.date | None = None) -> int:
+    """Queues DMs to every user watching an item Xûr sells this week
+
+    Users are notified at most once a week, even across restarts. Returns the
+    number of users queued"""
+    week = week or vendor_history.xur_week()
+    manifest_table = await api.get_manifest_table()
+    vendor = await vendor_history.load_vendor(manifest_table, week)
+    if vendor is None:
+        logger.warning(f"No stored Xur inventory for {week}, not notifying watchers")
+        return 0
+
+    if not await schemas.XurNotification.claim_week(WATCH_NOTIFICATION_KIND, week):
+        return 0
+    matches = bot.d.item_watches.match(vendor.sale_items, manifest_table)
+    for user_id, items_on_sale in matches.items():
+        bot.d.dm_dispatcher.submit(user_id, watch_notification(items_on_sale))
+
+    logger.info(f"Queued Xur watch notifications for {len(matches)} users")
+    return len(matches)
+
+
+@lb.command("watch", "Get a DM when Xûr sells an item")
+@lb.implements(lb.SlashCommandGroup)
+async def watch_group(ctx: lb.Context):
+    pass
+
+
+@watch_group.child
+@lb.option(
+    "item",
+    "Item to watch",
+    str,
+    required=True,
+    autocomplete=items.item_name_autocomplete,
+)
+@lb.command("add", "Get a DM when Xûr sells an item", ephemeral=True, pass_options=True)
+@lb.implements(lb.SlashSubCommand)
+async def watch_add(ctx: lb.Context, item: str):
+    item_entry = items.resolve_item(ctx.bot, item)
+    if item_entry is None:
+        return await ctx.respond(f"No item found matching '{item}'")
+
+    if len(await schemas.ItemWatch.get_watches(ctx.author.id)) >= MAX_WATCHES_PER_USER:
+        return await ctx.respond(
+            f"You can watch at most {MAX_WATCHES_PER_USER} items, "
+            + "remove one to watch another"
+        )
+
+    name = item_entry["displayProperties"]["name"]
+    if not await schemas.ItemWatch.add_watch(ctx.author.id, item_entry["hash"]):
+        return await ctx.respond(f"You are already watching {name}")
+
+    ctx.bot.d.item_watches.add(ctx.author.id, item_entry["hash"])
+    await ctx.respond(f"You will get a DM when Xûr sells {name}")
+
+
+async def watched_item_autocomplete(
+    option: h.AutocompleteInteractionOption,
+    interaction: h.AutocompleteInteraction,
+) -> t.List[h.CommandChoice]:
+    bot: lb.BotApp = interaction.app
+    value = str(option.value or "").casefold()
+    choices = []
+    for _, item_hash in await schemas.ItemWatch.get_watches(interaction.user.id):
+        name = items.item_name(bot, item_hash)
+        if value in name.casefold():
+            choices.append(h.CommandChoice(name=name[:100], value=str(item_hash)))
+    return choices[: items.MAX_AUTOCOMPLETE_CHOICES]
+
+
+@watch_group.child
+@lb.option(
+    "item",
+    "Item to stop watching",
+    str,
+    required=True,
+    autocomplete=watched_item_autocomplete,
+)
+@lb.command("remove", "Stop watching an item", ephemeral=True, pass_options=True)
+@lb.implements(lb.SlashSubCommand)
+async def watch_remove(ctx: lb.Context, item: str):
+    item_entry = items.resolve_item(ctx.bot, item)
+    item_hash = (
+        item_entry["hash"] if item_entry else int(item) if item.isdigit() else None
+    )
+
+    if item_hash is None or not await schemas.ItemWatch.remove_watch(
+        ctx.author.id, item_hash
+    ):
+        return await ctx.respond(f"You are not watching '{item}'")
+
+    ctx.bot.d.item_watches.remove(ctx.author.id, item_hash)
+    await ctx.respond(f"Stopped watching {items.item_name(ctx.bot, item_hash)}")
+
+
+@watch_group.child
+@lb.command("list", "List the items you are watching", ephemeral=True)
+@lb.implements(lb.SlashSubCommand)
+async def watch_list(ctx: lb.Context):
+    watches = await schemas.ItemWatch.get_watches(ctx.author.id)
+    if not watches:
+        return await ctx.respond("You are not watching any items")
+
+    await ctx.respond(
+        "You are watching:\n"
+        + "\n".join(
+            f"- {items.item_name(ctx.bot, item_hash)}" for _, item_hash in watches
+        )
+    )
+
+
+async def on_start_load_watches(event: lb.LightbulbStartedEvent):
+    bot: lb.BotApp = event.app
+    # Start first, so other notifications still go out if the watches fail to load
+    bot.d.dm_dispatcher.start()
+    bot.d.item_watches = WatchIndex(await schemas.ItemWatch.get_watches())
+    logger.info(f"Loaded {len(bot.d.item_watches)} item watches")
+
+
+def register(bot: lb.BotApp) -> None:
+    bot.d.item_watches = WatchIndex()
+    bot.d.dm_dispatcher = DMDispatcher(bot)
+
+    bot.command(watch_group)
+    bot.listen(lb.LightbulbStartedEvent)(on_start_load_watches)
@@ -15,6 +15,8 @@
 
 import asyncio as aio
 import datetime as dt
+import functools
+import hashlib
 import logging
 import typing as t
 
@@ -23,19 +25,28 @@ import aiohttp
 import aiohttp.web
 import hikari as h
 import lightbulb as lb
-import regex as re
 from hmessage import HMessage
 from sector_accounting import xur as xur_support_data
 
 from . import bungie_api as api
-from . import cfg, schemas, utils
+from . import (
+    armor_analytics,
+    cfg,
+    emojis,
+    render,
+    schemas,
+    sheets,
+    stat_alerts,
+    utils,
+    vendor_history,
+    watches,
+    xur_history,
+)
 from .autopost import make_autopost_control_commands
-from .embeds import substitute_user_side_emoji
+from .embeds import compile_emoji_substituter
 
 logger = logging.getLogger(__name__)
 
-re_masterwork = re.compile("Tier [0-9]: ")
-
 
 def xur_departure_string(post_date_time: dt.datetime | None = None) -> str:
     # Find the closest Tuesday in the future and set the time
@@ -64,6 +75,11 @@ def xur_location_fragment(
     return f"## **__Location__**\n:location: **{str(xur_location)}**\n"
 
 
+ARMOR_STAT_EMOJI_NAMES = tuple(
+    stat_name.lower() for stat_name in api.DestinyArmor._tracked_stats
+)
+
+
 def armor_stat_line_format(
     armor: api.DestinyArmor,
     simple_mode: bool = False,
@@ -72,10 +88,8 @@ def armor_stat_line_format(
 ) -> str:
     if simple_mode:
         return f"- Stat: {armor.stat_total}"
-    stats = armor.stats
     stat_line = f"**Σ {armor.stat_total}**:"
-    for stat_name, stat_value in stats.items():
-        stat_name = stat_name.lower()
+    for stat_name, stat_value in zip(ARMOR_STAT_EMOJI_NAMES, armor.stat_values):
         if stat_name in allowed_emoji_list:
             stat_line += f" :{stat_name}: `{stat_value}`"
         else:
@@ -126,16 +140,22 @@ def costs_string_from_items(
 
 
 def exotic_armor_fragment(
-    exotic_armor_pieces: t.List[api.DestinyArmor], allowed_emoji_list: t.List[str]
+    exotic_armor_pieces: t.List[api.DestinyArmor],
+    allowed_emoji_list: t.List[str],
+    roll_ranks: t.List[armor_analytics.ArmorRollRank | None] | None = None,
 ) -> str:
+    if roll_ranks is None:
+        roll_ranks = [None] * len(exotic_armor_pieces)
+
     subfragments: t.List[str] = []
-    for armor_piece in exotic_armor_pieces:
+    for armor_piece, roll_rank in zip(exotic_armor_pieces, roll_ranks):
         subfragments.append(
             f":{armor_piece.class_.lower().capitalize()}:  "
             + f"{armor_piece.class_.lower().capitalize()}: "
             + f"[**{armor_piece.name} "
             + f"({armor_piece.bucket})**]({armor_piece.lightgg_url})\n"
             + armor_stat_line_format(armor_piece, allowed_emoji_list=allowed_emoji_list)
+            + (f"\n*{roll_rank.summary()}*" if roll_rank else "")
         )
     return (
         "## **__Exotic Armor__**\n"
@@ -150,7 +170,7 @@ def weapon_line_format(
     weapon: api.DestinyWeapon,
     include_weapon_type: bool,
     # Either a list of perk indices or a callable that returns a list of perk indices
-    # based on a list of perks
+    # based on the weapon
     include_perks: t.List[int] | t.Callable,
     include_lightgg_link: bool,
     emoji_include_list: t.List[str] = ["weapon"],
@@ -174,7 +194,7 @@ def weapon_line_format(
 
     if include_perks:
         if callable(include_perks):
-            include_perks = include_perks(weapon.perks)
+            include_perks = include_perks(weapon)
         perks = []
         for perk_index in include_perks:
             if perk_index >= len(weapon.perks):
@@ -207,7 +227,11 @@ def exotic_weapons_fragment(
             weapon_line_format(
                 exotic_weapon,
                 include_weapon_type=False if exotic_weapon.name == "Hawkmoon" else True,
-                include_perks=[1] if exotic_weapon.name == "Hawkmoon" else [],
+                include_perks=(
+                    random_exotic_perk_column
+                    if exotic_weapon.name == "Hawkmoon"
+                    else []
+                ),
                 include_lightgg_link=True,
                 emoji_include_list=emoji_include_list,
             )
@@ -267,24 +291,19 @@ def legendary_armor_fragement(
     return "\n".join(subfragments)
 
 
-def last_two_active_perk_columns(perks: t.List[t.List[str]]) -> t.List[int]:
-    perks_to_return = []
-    for i, perk in enumerate(perks):
-        if len(perk) == 0:
-            continue
-        elif len(perk) > 2:
-            perks_to_return.append(i)
-            continue
-        else:
-            perk = perk[0]
-            if not (
-                "shader" in perk.lower()
-                or "tracker" in perk.lower()
-                or re_masterwork.search(perk)
-            ):
-                perks_to_return.append(i)
+def last_two_active_perk_columns(weapon: api.DestinyWeapon) -> t.List[int]:
+    if weapon.perk_column_kinds:
+        return weapon.perk_columns_of_kind(api.PlugKind.TRAIT)[-2:]
+    # Perks from the perks component are not in columns, show the last two
+    return list(range(len(weapon.perks)))[-2:]
 
-    return perks_to_return[-2:]
+
+def random_exotic_perk_column(weapon: api.DestinyWeapon) -> t.List[int]:
+    # With reusable plugs the random perk is in the last trait column,
+    # with only the perks component it is the second perk
+    if weapon.perk_column_kinds:
+        return weapon.perk_columns_of_kind(api.PlugKind.TRAIT)[-1:]
+    return [1]
 
 
 def legendary_weapons_fragment(
@@ -310,118 +329,420 @@ def legendary_weapons_fragment(
     return "\n".join(subfragments)
 
 
+async def exotic_armor_roll_ranks(
+    exotic_armor_pieces: t.List[api.DestinyArmor],
+    manifest_table: dict,
+) -> t.List[armor_analytics.ArmorRollRank | None] | None:
+    # Roll ranks are a nice to have, never let them hold up the post
+    try:
+        roll_history = await armor_analytics.exotic_armor_roll_history(manifest_table)
+        return roll_history.rank(exotic_armor_pieces)
+    except Exception as e:
+        e.add_note("Failed to rank exotic armor rolls\n")
+        logger.exception(e)
+        return None
+
+
+XUR_HEADER = "# [XÛR'S LOOT](https://kyber3000.com/D2-Xur)\n\n"
+
 XUR_FOOTER = """\n\n[**View More**](https://kyber3000.com/D2-Xur) ↗ 
 
 Have a great weekend! :gscheer:"""
 
 
-async def format_xur_vendor(
+def render_xur_vendor(
     vendor: api.DestinyVendor,
-    bot: lb.BotApp = {},
-) -> HMessage:
-    xur_locations = xur_support_data.XurLocations.from_gspread_url(
-        cfg.sheets_ls_url, cfg.gsheets_credentials
+    xur_locations: xur_support_data.XurLocations,
+    xur_armor_sets: xur_support_data.XurArmorSets,
+    emoji_dict: t.Mapping[str, h.Emoji],
+    roll_ranks: t.List[armor_analytics.ArmorRollRank | None] | None = None,
+) -> t.List[HMessage]:
+    """Renders the Xûr post from its already gathered inputs
+
+    A heavy week may not fit in one message, in which case the post continues
+    in the messages that follow the first"""
+    exotic_armor_pieces = [
+        item for item in vendor.sale_items if item.is_exotic and item.is_armor
+    ]
+    sections = [
+        xur_departure_string() + xur_location_fragment(vendor.location, xur_locations),
+        exotic_armor_fragment(
+            exotic_armor_pieces,
+            allowed_emoji_list=emoji_dict.keys(),
+            roll_ranks=roll_ranks,
+        ),
+        exotic_weapons_fragment(
+            [item for item in vendor.sale_items if item.is_exotic and item.is_weapon],
+            emoji_include_list=emoji_dict.keys(),
+        ),
+        exotic_catalysts_fragment(
+            [item for item in vendor.sale_items if item.is_exotic and item.is_catalyst],
+            emoji_include_list=emoji_dict.keys(),
+        ),
+        legendary_armor_fragement(
+            [item for item in vendor.sale_items if item.is_armor and item.is_legendary],
+            xur_armor_sets,
+            emoji_include_list=emoji_dict.keys(),
+        ),
+        legendary_weapons_fragment(
+            [
+                item
+                for item in vendor.sale_items
+                if item.is_weapon and item.is_legendary
+            ],
+            emoji_include_list=emoji_dict.keys(),
+        ),
+    ]
+
+    substituter = compile_emoji_substituter(emoji_dict)
+    messages = render.pack_sections(
+        [substituter.substitute(section) for section in sections],
+        header=substituter.substitute_static(XUR_HEADER),
+        footer=substituter.substitute_static(XUR_FOOTER),
     )
-    xur_armor_sets = xur_support_data.XurArmorSets.from_gspread_url(
-        cfg.sheets_ls_url, cfg.gsheets_credentials
+    return [
+        HMessage(
+            embeds=render.embeds_from_descriptions(
+                descriptions,
+                color=h.Color(cfg.embed_default_color),
+                url="https://kyberscorner.com",
+            )
+        )
+        for descriptions in messages
+    ]
+
+
+def render_xur_placeholder(emoji_dict: t.Mapping[str, h.Emoji]) -> HMessage:
+    """Renders the parts of the Xûr post that do not depend on his inventory"""
+    substituter = compile_emoji_substituter(emoji_dict)
+    return HMessage(
+        embeds=render.embeds_from_descriptions(
+            [
+                substituter.substitute_static(XUR_HEADER)
+                + substituter.substitute(xur_departure_string())
+                + "\nFetching Xûr's inventory from the API..."
+                + substituter.substitute_static(XUR_FOOTER)
+            ],
+            color=h.Color(cfg.embed_default_color),
+            url="https://kyberscorner.com",
+        )
     )
 
-    guild = bot.cache.get_guild(
-        cfg.kyber_discord_server_id
-    ) or await bot.rest.fetch_guild(cfg.kyber_discord_server_id)
 
-    emoji_dict = {emoji.name: emoji for emoji in await guild.fetch_emojis()}
+async def format_xur_vendor(
+    vendor: api.DestinyVendor,
+    manifest_table: dict,
+    bot: lb.BotApp = {},
+    on_stage: t.Callable[[t.List[HMessage]], t.Any] | None = None,
+) -> t.List[HMessage]:
+    """Formats the Xûr post for a vendor parsed with `manifest_table`
+
+    If `on_stage` is given, it is called with the post rendered so far before
+    the slower, optional parts of the post are added"""
+    sheet_snapshot = await sheets.workbook.get()
+    emoji_dict = await emojis.get_emoji_registry(bot)
+
+    if on_stage:
+        on_stage(
+            render_xur_vendor(
+                vendor,
+                sheet_snapshot.xur_locations,
+                sheet_snapshot.xur_armor_sets,
+                emoji_dict,
+            )
+        )
 
-    description = "# [XÛR'S LOOT](https://kyber3000.com/D2-Xur)\n\n"
-    description += xur_departure_string()
-    description += xur_location_fragment(vendor.location, xur_locations)
-    description += exotic_armor_fragment(
+    roll_ranks = await exotic_armor_roll_ranks(
         [item for item in vendor.sale_items if item.is_exotic and item.is_armor],
-        allowed_emoji_list=emoji_dict.keys(),
-    )
-    description += exotic_weapons_fragment(
-        [item for item in vendor.sale_items if item.is_exotic and item.is_weapon],
-        emoji_include_list=emoji_dict.keys(),
-    )
-    description += exotic_catalysts_fragment(
-        [item for item in vendor.sale_items if item.is_exotic and item.is_catalyst],
-        emoji_include_list=emoji_dict.keys(),
-    )
-    description += legendary_armor_fragement(
-        [item for item in vendor.sale_items if item.is_armor and item.is_legendary],
-        xur_armor_sets,
-        emoji_include_list=emoji_dict.keys(),
-    )
-    description += legendary_weapons_fragment(
-        [item for item in vendor.sale_items if item.is_weapon and item.is_legendary],
-        emoji_include_list=emoji_dict.keys(),
+        manifest_table,
     )
 
-    description += XUR_FOOTER
-    description = await substitute_user_side_emoji(emoji_dict, description)
-    message = HMessage(
-        embeds=[
-            h.Embed(
-                description=description,
-                color=h.Color(cfg.embed_default_color),
-                url="https://kyberscorner.com",
-            )
-        ]
+    return render_xur_vendor(
+        vendor,
+        sheet_snapshot.xur_locations,
+        sheet_snapshot.xur_armor_sets,
+        emoji_dict,
+        roll_ranks=roll_ranks,
     )
-    return message
 
 
-async def fetch_xur_data(webserver_runner: aiohttp.web.AppRunner) -> api.DestinyVendor:
+async def fetch_xur_vendor_responses(
+    webserver_runner: aiohttp.web.AppRunner,
+) -> t.List[dict]:
+    await api.check_bungie_api_online(raise_exception=True)
+
     access_token = await api.refresh_api_tokens(webserver_runner)
 
     async with aiohttp.ClientSession() as session:
         destiny_membership = await api.DestinyMembership.from_api(session, access_token)
         character_id = await destiny_membership.get_character_id(session, access_token)
 
-    manifest_table = await api._build_manifest_dict(
-        await api._get_latest_manifest(schemas.BungieCredentials.api_key)
+    return [
+        await api.DestinyVendor.request_response_from_api(
+            destiny_membership=destiny_membership,
+            character_id=character_id,
+            access_token=access_token,
+            vendor_hash=vendor_hash,
+        )
+        for vendor_hash in vendor_history.XUR_VENDOR_HASHES
+    ]
+
+
+async def fetch_xur_data(
+    webserver_runner: aiohttp.web.AppRunner, manifest_table: dict | None = None
+) -> api.DestinyVendor:
+    manifest_table = manifest_table or await api.get_manifest_table()
+
+    try:
+        responses = await fetch_xur_vendor_responses(webserver_runner)
+    except (
+        api.APIOfflineException,
+        aiohttp.ClientError,
+        aio.TimeoutError,
+        KeyError,
+    ) as e:
+        # Fall back to this week's stored inventory if we have it
+        xur = await vendor_history.load_vendor(manifest_table)
+        if xur is None:
+            raise
+        logger.warning(f"Using stored Xur inventory, could not fetch it: {e!r}")
+        return xur
+
+    for response in responses:
+        try:
+            await vendor_history.store_vendor_response(response)
+        except Exception as e:
+            e.add_note("Failed to store vendor snapshot\n")
+            logger.exception(e)
+
+    xur = vendor_history.parse_vendor_responses(responses, manifest_table)
+    try:
+        await xur_history.index_vendor(xur)
+    except Exception as e:
+        e.add_note("Failed to index Xur inventory\n")
+        logger.exception(e)
+
+    return xur
+
+
+async def xur_message_constructor(
+    bot: lb.BotApp, on_stage: t.Callable[[t.List[HMessage]], t.Any] | None = None
+) -> t.List[HMessage]:
+    manifest_table = await api.get_manifest_table()
+    xur = await fetch_xur_data(bot.d.webserver_runner, manifest_table)
+    return await format_xur_vendor(xur, manifest_table, bot=bot, on_stage=on_stage)
+
+
+_render_cache = render.RenderCache()
+
+
+async def cached_xur_message_constructor(bot: lb.BotApp) -> t.List[HMessage]:
+    """Returns the Xûr post, reusing the last render if none of its inputs changed
+
+    Renders are keyed by this week's stored vendor snapshots along with the
+    manifest, sheet and emoji versions. Until a snapshot is stored for the week,
+    and while Xûr is away, the post is rendered from the API every time."""
+    now = dt.datetime.now(tz=dt.timezone.utc)
+    week = vendor_history.xur_week(now)
+    # The week's snapshots outlive Xûr's visit, so only stand in for the API
+    # while he is actually around
+    if not (
+        vendor_history.xur_arrival(week) <= now < vendor_history.xur_departure(week)
+    ):
+        return await xur_message_constructor(bot)
+
+    snapshots = await vendor_history.load_vendor_snapshots(week)
+    if snapshots is None:
+        return await xur_message_constructor(bot)
+
+    manifest_table = await api.get_manifest_table()
+    sheet_snapshot = await sheets.workbook.get()
+    emoji_registry = await emojis.get_emoji_registry(bot)
+    fingerprint = (
+        week,
+        hashlib.sha256(b"".join(snapshots)).digest(),
+        manifest_table.version,
+        sheet_snapshot.version,
+        emoji_registry.version,
     )
 
-    xur: api.DestinyVendor = await api.DestinyVendor.request_from_api(
-        destiny_membership=destiny_membership,
-        character_id=character_id,
-        access_token=access_token,
-        manifest_table=manifest_table,
-        vendor_hash=api.XUR_VENDOR_HASH,
+    async def render_xur_post():
+        vendor = vendor_history.vendor_from_snapshots(snapshots, manifest_table)
+        return await format_xur_vendor(vendor, manifest_table, bot=bot)
+
+    return await _render_cache.get_or_render(fingerprint, render_xur_post)
+
+
+# Seconds between attempts to fetch Xûr's inventory once he is due to arrive
+PRERENDER_RETRY_DELAY = 10
+# Seconds after Xûr's arrival to stop trying to pre-render, after which the post
+# is rendered by the announcer as usual
+PRERENDER_DEADLINE = 600
+# Errors to expect while Xûr's inventory is not live yet
+PRERENDER_TRANSIENT_ERRORS = (
+    api.VendorNotFound,
+    api.APIOfflineException,
+    aiohttp.ClientError,
+    aio.TimeoutError,
+    KeyError,
+)
+
+
+async def warm_xur_inputs(bot: lb.BotApp, week: dt.date):
+    """Loads everything the Xûr post for a week needs other than Xûr's inventory
+    itself"""
+
+    async def warm_roll_history():
+        await armor_analytics.exotic_armor_roll_history(
+            await api.get_manifest_table(), before_week=week
+        )
+
+    results = await aio.gather(
+        # Also loads the manifest
+        warm_roll_history(),
+        # Keep the token valid until well after the post goes out
+        api.refresh_api_tokens(
+            bot.d.webserver_runner,
+            min_validity=dt.timedelta(seconds=PRERENDER_DEADLINE + 1200),
+        ),
+        sheets.workbook.refresh(),
+        bot.d.emoji_registry.fetch(bot),
+        return_exceptions=True,
     )
+    for result in results:
+        if isinstance(result, Exception):
+            result.add_note("Failed to warm Xur post input\n")
+            logger.exception(result)
+
 
-    xur += await api.DestinyVendor.request_from_api(
-        destiny_membership=destiny_membership,
-        character_id=character_id,
-        access_token=access_token,
-        manifest_table=manifest_table,
-        vendor_hash=api.XUR_STRANGE_GEAR_VENDOR_HASH,
+async def prerender_xur(
+    bot: lb.BotApp,
+    week: dt.date,
+    on_stage: t.Callable[[t.List[HMessage]], t.Any] | None = None,
+) -> t.List[HMessage]:
+    """Renders the Xûr post for a week as soon as his inventory is live
+
+    Inputs are warmed straight away, then the inventory is polled from the
+    moment Xûr is due to arrive until it can be fetched. Gives up with a
+    TimeoutError `PRERENDER_DEADLINE` seconds after he arrives, and straight
+    away on errors other than his inventory not being live yet"""
+    await warm_xur_inputs(bot, week)
+
+    arrival = vendor_history.xur_arrival(week)
+    deadline = arrival + dt.timedelta(seconds=PRERENDER_DEADLINE)
+    await aio.sleep(
+        max((arrival - dt.datetime.now(tz=dt.timezone.utc)).total_seconds(), 0)
     )
 
-    return xur
+    while True:
+        try:
+            return await xur_message_constructor(bot, on_stage=on_stage)
+        except PRERENDER_TRANSIENT_ERRORS as e:
+            if dt.datetime.now(tz=dt.timezone.utc) >= deadline:
+                raise aio.TimeoutError(f"Xur inventory not ready by {deadline}") from e
+            logger.info(f"Xur inventory not ready for pre-render yet: {e!r}")
+            await aio.sleep(PRERENDER_RETRY_DELAY)
+
+
+class XurPrerender:
+    """A pre-render of the Xûr post for a week, whose stages can be followed
+
+    Followers are called with each stage of the render as it completes, and
+    straight away with the latest stage if one was already rendered"""
+
+    def __init__(self, bot: lb.BotApp, week: dt.date):
+        self.week = week
+        self.stage: t.List[HMessage] | None = None
+        self._followers: t.List[t.Callable[[t.List[HMessage]], t.Any]] = []
+        self.task = aio.create_task(prerender_xur(bot, week, on_stage=self._on_stage))
+
+    def _on_stage(self, stage: t.List[HMessage]):
+        self.stage = stage
+        for on_stage in self._followers:
+            on_stage(stage)
+
+    def follow(self, on_stage: t.Callable[[t.List[HMessage]], t.Any]):
+        if self.stage is not None:
+            on_stage(self.stage)
+        self._followers.append(on_stage)
+
+    def unfollow(self, on_stage: t.Callable[[t.List[HMessage]], t.Any]):
+        self._followers.remove(on_stage)
+
+
+async def start_xur_prerender(bot: lb.BotApp) -> XurPrerender | None:
+    """Starts pre-rendering the post for Xûr's next visit, if not already started
+
+    Does nothing while Xûr autoposts are disabled"""
+    if not await schemas.AutoPostSettings.get_xur_enabled():
+        return None
+
+    # Xûr's next visit is the week after the one in progress
+    week = vendor_history.xur_week() + dt.timedelta(days=7)
+    prerender: XurPrerender | None = bot.d.get("xur_prerender")
+    if prerender is None or prerender.week != week:
+        bot.d.xur_prerender = XurPrerender(bot, week)
+    return bot.d.xur_prerender
+
+
+async def prerendered_xur_message_constructor(
+    bot: lb.BotApp, on_stage: t.Callable[[t.List[HMessage]], t.Any] | None = None
+) -> t.List[HMessage]:
+    """Returns this week's pre-rendered post, rendering it now if it was not or
+    if the pre-render failed
+
+    `on_stage` follows the stages of the pre-render while it is in progress"""
+    prerender: XurPrerender | None = bot.d.get("xur_prerender")
+    if prerender is not None and prerender.week == vendor_history.xur_week():
+        if on_stage:
+            prerender.follow(on_stage)
+        try:
+            return await aio.shield(prerender.task)
+        except Exception as e:
+            e.add_note("Xur pre-render failed, rendering the post now\n")
+            logger.exception(e)
+        finally:
+            if on_stage:
+                prerender.unfollow(on_stage)
+    return await xur_message_constructor(bot, on_stage=on_stage)
 
 
-async def xur_message_constructor(bot: lb.BotApp) -> HMessage:
-    xur = await fetch_xur_data(bot.d.webserver_runner)
-    return await format_xur_vendor(xur, bot=bot)
+async def publish_xur_stage(msg: h.Message, stage: t.List[HMessage]):
+    # Only the first message is published progressively, any that follow are
+    # sent once the post is complete
+    try:
+        await utils.message_editor.edit(msg, stage[0])
+    except Exception as e:
+        # The final edit will bring the post up to date regardless
+        e.add_note("Failed to publish Xur post stage\n")
+        logger.exception(e)
 
 
 async def xur_discord_announcer(
     bot: lb.BotApp,
     channel_id: int,
-    construct_message_coro: t.Coroutine[t.Any, t.Any, HMessage] = None,
+    construct_message_coro: t.Coroutine[t.Any, t.Any, t.List[HMessage]] = None,
     check_enabled: bool = False,
     enabled_check_coro: t.Coroutine[t.Any, t.Any, bool] = None,
     publish_message: bool = True,
+    progressive: bool = False,
 ):
-    hmessage = HMessage(
-        embeds=[
-            h.Embed(
-                description="Waiting for Xur data from the API...",
-                color=cfg.embed_default_color,
-            )
-        ]
-    )
+    """Announces Xûr, sending a placeholder first and editing the post into it
+
+    In progressive mode the placeholder already shows what is known before Xûr's
+    inventory is, and the post is published as soon as his inventory is, before
+    the roll ranks are added, through coalesced edits."""
+    if progressive:
+        hmessage = render_xur_placeholder(await emojis.get_emoji_registry(bot))
+    else:
+        hmessage = HMessage(
+            embeds=[
+                h.Embed(
+                    description="Waiting for Xur data from the API...",
+                    color=cfg.embed_default_color,
+                )
+            ]
+        )
     msg = await utils.send_message(
         bot,
         hmessage,
@@ -429,6 +750,13 @@ async def xur_discord_announcer(
         crosspost=False,
         deduplicate=True,
     )
+    utils.message_editor.remember(msg.id, hmessage)
+
+    if progressive:
+        construct_message_coro = functools.partial(
+            construct_message_coro,
+            on_stage=lambda stage: aio.create_task(publish_xur_stage(msg, stage)),
+        )
 
     while True:
         retries = 0
@@ -436,9 +764,7 @@ async def xur_discord_announcer(
             if check_enabled and not await enabled_check_coro():
                 return
 
-            await api.check_bungie_api_online(raise_exception=True)
-
-            hmessage: HMessage = await construct_message_coro(bot)
+            hmessages: t.List[HMessage] = await construct_message_coro(bot)
         except api.APIOfflineException as e:
             logger.exception(e)
             retries += 1
@@ -455,7 +781,7 @@ async def xur_discord_announcer(
         try:
             if check_enabled and not await enabled_check_coro():
                 return
-            await msg.edit(**hmessage.to_message_kwargs())
+            await utils.message_editor.edit(msg, hmessages[0])
         except Exception as e:
             logger.exception(e)
             retries += 1
@@ -465,8 +791,23 @@ async def xur_discord_announcer(
     if publish_message:
         await utils.crosspost_message_with_retries(bot, channel_id, msg.id)
 
+    # The rest of a post that did not fit in one message
+    for hmessage in hmessages[1:]:
+        await utils.send_message(
+            bot,
+            hmessage,
+            channel_id=channel_id,
+            crosspost=publish_message,
+            deduplicate=True,
+        )
+
 
 async def on_start_schedule_autoposts(event: lb.LightbulbStartedEvent):
+    # Start pre-rendering 10 minutes before Xûr arrives
+    @aiocron.crontab("50 16 * * FRI", start=True)
+    async def prerender_xur_post():
+        await start_xur_prerender(event.app)
+
     # Run every day at 17:00 UTC
     @aiocron.crontab("0 17 * * FRI", start=True)
     # Use below crontab for testing to post every minute
@@ -477,22 +818,24 @@ async def on_start_schedule_autoposts(event: lb.LightbulbStartedEvent):
             channel_id=cfg.followables["xur"],
             check_enabled=True,
             enabled_check_coro=schemas.AutoPostSettings.get_lost_sector_enabled,
-            construct_message_coro=xur_message_constructor,
+            construct_message_coro=prerendered_xur_message_constructor,
+            progressive=True,
         )
+        await watches.notify_watchers(event.app)
+        await stat_alerts.notify_alerts(event.app)
 
 
 def register(bot: lb.BotApp) -> None:
     bot.listen(lb.LightbulbStartedEvent)(on_start_schedule_autoposts)
-    bot.command(
-        make_autopost_control_commands(
-            autopost_name="xur",
-            enabled_getter=schemas.AutoPostSettings.get_xur_enabled,
-            enabled_setter=schemas.AutoPostSettings.set_xur,
-            channel_id=cfg.followables["xur"],
-            message_constructor_coro=xur_message_constructor,
-            message_announcer_coro=xur_discord_announcer,
-        )
+    autopost_control_parent_group = make_autopost_control_commands(
+        autopost_name="xur",
+        enabled_getter=schemas.AutoPostSettings.get_xur_enabled,
+        enabled_setter=schemas.AutoPostSettings.set_xur,
+        channel_id=cfg.followables["xur"],
+        message_constructor_coro=cached_xur_message_constructor,
+        message_announcer_coro=xur_discord_announcer,
     )
+    bot.command(autopost_control_parent_group)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,279 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+"""Offline benchmark of the Xûr post rendering
+
+Record a fixture from live data once, with the bot's environment configured:
+
+    python -m polarity.xur_benchmark --record [fixture path]
+
+and then benchmark rendering from it as often as needed, offline:
+
+    python -m polarity.xur_benchmark --run [fixture path]
+
+The fixture holds the pruned vendor responses, the guild's emojis and the sheet
+data the post uses, along with the manifest entries the responses refer to, so
+it runs without the manifest it was recorded with. Running makes no Discord,
+Bungie, Google Sheets or database requests. The polarity modules it benchmarks
+still read the bot's environment variables when imported, so those must be
+set, though the credentials in them are never used."""
+
+import asyncio as aio
+import json
+import sys
+import timeit
+import tracemalloc
+import typing as t
+from pathlib import Path
+
+import attr
+import hikari as h
+
+from . import bungie_api as api
+from . import emojis, vendor_history, xur
+
+XUR_FIXTURE_PATH = Path("benchmarks") / "xur_fixture.json"
+# Timing repeats, the best of which is reported
+REPEATS = 5
+# Tables whose entries are kept in the fixture without following the hashes they
+# refer to. Vendor definitions refer to every item the vendor has ever sold, and
+# presentation nodes to every collectible under them
+FIXTURE_LEAF_TABLES = {
+    "DestinyVendorDefinition",
+    "DestinyDestinationDefinition",
+    "DestinyPresentationNodeDefinition",
+}
+
+
+def _referenced_hashes(data: t.Any) -> t.Set[int]:
+    """Returns every integer in a json value, including keys that are integers"""
+    hashes = set()
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            hashes.update(
+                int(key) for key in value if isinstance(key, str) and key.isdigit()
+            )
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, int) and not isinstance(value, bool):
+            hashes.add(value)
+    return hashes
+
+
+def manifest_subset(
+    manifest_table: dict, data: t.Any
+) -> t.Dict[str, t.Dict[int, dict]]:
+    """Returns the manifest entries `data` refers to by hash, along with those
+    they refer to in turn"""
+    subset: t.Dict[str, t.Dict[int, dict]] = {name: {} for name in manifest_table}
+    pending = _referenced_hashes(data)
+    seen = set()
+    while pending:
+        seen |= pending
+        referenced = set()
+        for name, table in manifest_table.items():
+            for hash_ in pending:
+                if hash_ in table and hash_ not in subset[name]:
+                    subset[name][hash_] = table[hash_]
+                    if name not in FIXTURE_LEAF_TABLES:
+                        referenced |= _referenced_hashes(table[hash_])
+        pending = referenced - seen
+    return subset
+
+
+async def record_fixture(path: Path = XUR_FIXTURE_PATH):
+    """Records the inputs of this week's Xûr post to a fixture"""
+    # Only recording talks to Discord and the sheet
+    from . import cfg, sheets
+
+    responses = await xur.fetch_xur_vendor_responses(api.webserver_runner_preparation())
+    responses = [
+        vendor_history._prune_vendor_response(response) for response in responses
+    ]
+    manifest_table = await api.get_manifest_table()
+    vendor = vendor_history.parse_vendor_responses(responses, manifest_table)
+    sheet_snapshot = await sheets.workbook.get()
+
+    rest_app = h.RESTApp()
+    await rest_app.start()
+    try:
+        async with rest_app.acquire(cfg.discord_token, h.TokenType.BOT) as rest:
+            guild_emojis = await rest.fetch_guild_emojis(cfg.kyber_discord_server_id)
+    finally:
+        await rest_app.close()
+
+    armor_set_names = {
+        item.armor_set_name
+        for item in vendor.sale_items
+        if item.is_armor and item.is_legendary and item.armor_set_name
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "emoji_guild_id": cfg.kyber_discord_server_id,
+                "manifest_version": manifest_table.version,
+                "manifest": manifest_subset(manifest_table, responses),
+                "vendor_responses": responses,
+                "emojis": [
+                    {
+                        "id": int(emoji.id),
+                        "name": emoji.name,
+                        "animated": emoji.is_animated,
+                    }
+                    for emoji in guild_emojis
+                ],
+                "xur_locations": {
+                    vendor.location: str(sheet_snapshot.xur_locations[vendor.location])
+                },
+                "xur_armor_sets": {
+                    name: str(sheet_snapshot.xur_armor_sets[name])
+                    for name in armor_set_names
+                },
+            },
+            f,
+        )
+    print(f"Recorded Xur fixture to {path}")
+
+
+@attr.s(frozen=True)
+class BenchmarkResult:
+    name: str = attr.ib()
+    calls: int = attr.ib()
+    seconds_per_call: float = attr.ib()
+    peak_bytes: int = attr.ib()
+    retained_bytes: int = attr.ib()
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name:<32} {self.seconds_per_call * 1e6:>12.1f} µs"
+            + f" {self.peak_bytes / 1024:>12.1f} KiB"
+            + f" {self.retained_bytes / 1024:>12.1f} KiB"
+        )
+
+
+def benchmark(name: str, func: t.Callable[[], t.Any]) -> BenchmarkResult:
+    """Times the best of `REPEATS` runs of `func` and traces the memory allocated
+    by a single call"""
+    timer = timeit.Timer(func)
+    calls, _ = timer.autorange()
+    seconds_per_call = min(timer.repeat(repeat=REPEATS, number=calls)) / calls
+
+    tracemalloc.start()
+    try:
+        func()
+        retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(name, calls, seconds_per_call, peak_bytes, retained_bytes)
+
+
+async def run_benchmarks(path: Path = XUR_FIXTURE_PATH) -> t.List[BenchmarkResult]:
+    with open(path) as f:
+        fixture = json.load(f)
+
+    # Json object keys are strings, manifest tables are keyed by integer hashes
+    manifest_table = api.ManifestTable(
+        {
+            name: {int(hash_): entry for hash_, entry in table.items()}
+            for name, table in fixture["manifest"].items()
+        },
+        version=fixture["manifest_version"],
+    )
+    responses = fixture["vendor_responses"]
+    vendor = vendor_history.parse_vendor_responses(responses, manifest_table)
+
+    emoji_dict = emojis.EmojiRegistry(fixture["emoji_guild_id"])
+    emoji_dict.update(
+        h.CustomEmoji(
+            id=h.Snowflake(emoji["id"]),
+            name=emoji["name"],
+            is_animated=emoji["animated"],
+        )
+        for emoji in fixture["emojis"]
+    )
+    xur_locations = fixture["xur_locations"]
+    xur_armor_sets = fixture["xur_armor_sets"]
+
+    sale_items = vendor.sale_items
+    exotic_armor = [item for item in sale_items if item.is_exotic and item.is_armor]
+    legendary_armor = [
+        item for item in sale_items if item.is_armor and item.is_legendary
+    ]
+    weapons = [item for item in sale_items if item.is_weapon]
+
+    return [
+        benchmark(
+            "parse_vendor_responses",
+            lambda: vendor_history.parse_vendor_responses(responses, manifest_table),
+        ),
+        benchmark(
+            "exotic_armor_fragment",
+            lambda: xur.exotic_armor_fragment(exotic_armor, emoji_dict.keys()),
+        ),
+        benchmark(
+            f"weapon_line_format (x{len(weapons)})",
+            lambda: [
+                xur.weapon_line_format(
+                    weapon,
+                    include_weapon_type=True,
+                    include_perks=xur.last_two_active_perk_columns,
+                    include_lightgg_link=True,
+                    emoji_include_list=emoji_dict.keys(),
+                )
+                for weapon in weapons
+            ],
+        ),
+        benchmark(
+            "costs_string_from_items",
+            lambda: xur.costs_string_from_items(sale_items, emoji_dict.keys()),
+        ),
+        benchmark(
+            "legendary_armor_fragement",
+            lambda: xur.legendary_armor_fragement(
+                legendary_armor, xur_armor_sets, emoji_dict.keys()
+            ),
+        ),
+        benchmark(
+            "render_xur_vendor",
+            lambda: xur.render_xur_vendor(
+                vendor, xur_locations, xur_armor_sets, emoji_dict
+            ),
+        ),
+    ]
+
+
+async def main():
+    path = Path(sys.argv[-1]) if sys.argv[-1].endswith(".json") else XUR_FIXTURE_PATH
+
+    if "--record" in sys.argv:
+        await record_fixture(path)
+
+    if "--run" in sys.argv:
+        results = await run_benchmarks(path)
+        print(
+            f"{'Benchmark':<32} {'Time/call':>15} {'Peak alloc':>16} {'Retained':>16}"
+        )
+        for result in results:
+            print(result)
+
+
+if __name__ == "__main__":
+    aio.run(main())
@@ -0,0 +1,165 @@
+# Copyright © 2019-present gsfernandes81
+
+# This file is part of "mortal-polarity".
+
+# mortal-polarity is free software: you can redistribute it and/or modify it under the
+# terms of the GNU Affero General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later version.
+
+# "mortal-polarity" is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. See the GNU Affero General Public License for more details.
+
+# You should have received a copy of the GNU Affero General Public License along with
+# mortal-polarity. If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio as aio
+import datetime as dt
+import logging
+import typing as t
+
+import lightbulb as lb
+
+from . import bungie_api as api
+from . import items, schemas, vendor_history
+
+logger = logging.getLogger(__name__)
+
+MAX_HISTORY_WEEKS = 10
+
+_ingest_lock = aio.Lock()
+
+
+def sale_roll(item: api.DestinyItem) -> str | None:
+    """Summarises the roll of a sold item, or None if it has no random roll"""
+    if isinstance(item, api.DestinyArmor) and item.stat_total:
+        return (
+            " / ".join(
+                f"{value} {stat_name[:3]}"
+                for stat_name, value in zip(
+                    api.DestinyArmor._tracked_stats, item.stat_values
+                )
+            )
+            + f", Σ {item.stat_total}"
+        )
+    if isinstance(item, api.DestinyWeapon) and item.perks:
+        # With reusable plugs the last columns are trackers, shaders and the
+        # like, the roll is in the last two trait columns
+        if item.perk_column_kinds:
+            columns = item.perk_columns_of_kind(api.PlugKind.TRAIT)[-2:]
+        else:
+            columns = list(range(len(item.perks)))[-2:]
+        return (
+            ", ".join(
+                (
+                    " / ".join(item.perks[column])
+                    if isinstance(item.perks[column], tuple)
+                    else item.perks[column]
+                )
+                for column in columns
+            )[:256]
+            or None
+        )
+    return None
+
+
+def vendor_sales(
+    vendor: api.DestinyVendor,
+) -> t.List[t.Tuple[int, str | None, str | None]]:
+    """Returns the (item_hash, location, roll) index rows for a vendor"""
+    return [(item.hash, vendor.location, sale_roll(item)) for item in vendor.sale_items]
+
+
+async def index_vendor(vendor: api.DestinyVendor, week: dt.date | None = None):
+    """Indexes a freshly fetched inventory, unless its week is already indexed"""
+    week = week or vendor_history.xur_week()
+    async with _ingest_lock:
+        if week in await schemas.XurItemSale.get_indexed_weeks():
+            return
+        await schemas.XurItemSale.set_week_sales(week, vendor_sales(vendor))
+    logger.info(f"Indexed Xur inventory for {week}")
+
+
+async def ingest_new_weeks() -> int:
+    """Indexes stored inventories for weeks that are not indexed yet
+
+    Only snapshots of weeks missing from the index are decoded, so this is
+    cheap to run on every startup. Returns the number of weeks indexed"""
+    async with _ingest_lock:
+        new_weeks = sorted(
+            await schemas.VendorSnapshot.get_weeks()
+            - await schemas.XurItemSale.get_indexed_weeks()
+        )
+        if not new_weeks:
+            return 0
+
+        manifest_table = await api.get_manifest_table()
+        indexed = 0
+        for week in new_weeks:
+            vendor = await vendor_history.load_vendor(manifest_table, week)
+            if vendor is None:
+                # Not every vendor was stored for this week
+                continue
+            await schemas.XurItemSale.set_week_sales(week, vendor_sales(vendor))
+            indexed += 1
+
+    logger.info(f"Indexed Xur inventories for {indexed} new weeks")
+    return indexed
+
+
+def format_item_history(
+    name: str, sales: t.List[t.Tuple[dt.date, str | None, str | None]]
+) -> str:
+    lines = [f"**{name}** was last sold by Xûr:"]
+    for week, location, roll in sales:
+        line = f"- <t:{int(vendor_history.xur_arrival(week).timestamp())}:D>"
+        if location:
+            line += f" at {location}"
+        if roll:
+            line += f": {roll}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+@lb.option(
+    "item",
+    "Item to look up",
+    str,
+    required=True,
+    autocomplete=items.item_name_autocomplete,
+)
+# Top level, as the /xur group is the control server's autopost group. Like
+# /watch and /alert, it is enabled in the default guilds from cfg
+@lb.command(
+    "xur_history",
+    "Check when Xûr last sold an item",
+    auto_defer=True,
+    pass_options=True,
+)
+@lb.implements(lb.SlashCommand)
+async def xur_history_command(ctx: lb.Context, item: str):
+    item_entry = items.resolve_item(ctx.bot, item)
+    if item_entry is None:
+        return await ctx.respond(f"No item found matching '{item}'")
+
+    name = item_entry["displayProperties"]["name"]
+    sales = await schemas.XurItemSale.get_item_sales(
+        item_entry["hash"], limit=MAX_HISTORY_WEEKS
+    )
+    if not sales:
+        return await ctx.respond(f"Xûr has not sold {name} since records began")
+
+    await ctx.respond(format_item_history(name, sales))
+
+
+async def on_start_ingest_history(event: lb.LightbulbStartedEvent):
+    try:
+        await ingest_new_weeks()
+    except Exception as e:
+        e.add_note("Failed to index stored Xur inventories\n")
+        logger.exception(e)
+
+
+def register(bot: lb.BotApp) -> None:
+    bot.command(xur_history_command)
+    bot.listen(lb.LightbulbStartedEvent)(on_start_ingest_history)